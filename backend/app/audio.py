@@ -0,0 +1,258 @@
+"""CPU-bound audio decoding and MFCC fingerprinting for the sound-health endpoints.
+
+Kept apart from `app.main` so process-pool workers import only numpy, librosa
+and soundfile, not the FastAPI app and its API clients.
+"""
+from typing import IO, Iterator, NamedTuple, Optional
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+import numpy as np
+import librosa
+import soundfile as sf
+import soxr
+
+# Clips shorter than this (after decoding) are skipped before MFCC extraction.
+MIN_CLIP_SECONDS = float(os.getenv("MIN_CLIP_SECONDS", "0.5"))
+FFMPEG_TIMEOUT_S = float(os.getenv("FFMPEG_TIMEOUT_S", "60"))
+
+
+class DecodedAudio(NamedTuple):
+    signal: np.ndarray  # mono float32 at sample_rate
+    sample_rate: int
+    duration: float  # seconds
+
+
+def _ffmpeg_decode(audio_bytes: bytes, ext: str) -> tuple[np.ndarray, int]:
+    """Decode compressed audio (m4a/aac, ...) with ffmpeg into 16-bit PCM at the native rate.
+
+    The bytes are piped through stdin. MP4 files with a trailing `moov` atom
+    can't be demuxed from a pipe, so those fall back to a temp file for ffmpeg
+    to seek in. The output is an AU stream (its header carries the rate and
+    channels), which soundfile reads back from memory.
+    """
+    cmd = ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error"]
+    out_args = ["-vn", "-f", "au", "-acodec", "pcm_s16be", "pipe:1"]
+
+    proc = subprocess.run(
+        cmd + ["-i", "pipe:0"] + out_args,
+        input=audio_bytes,
+        capture_output=True,
+        timeout=FFMPEG_TIMEOUT_S,
+    )
+    if proc.returncode != 0 or not proc.stdout:
+        with tempfile.NamedTemporaryFile(suffix=ext, delete=True) as temp_file:
+            temp_file.write(audio_bytes)
+            temp_file.flush()
+            proc = subprocess.run(
+                cmd + ["-i", temp_file.name] + out_args,
+                capture_output=True,
+                timeout=FFMPEG_TIMEOUT_S,
+            )
+    if proc.returncode != 0 or not proc.stdout:
+        raise RuntimeError(f"ffmpeg decode failed: {proc.stderr.decode(errors='ignore')[:200]}")
+
+    with sf.SoundFile(io.BytesIO(proc.stdout)) as pcm:
+        return pcm.read(dtype="float32", always_2d=False).T, pcm.samplerate
+
+
+def decode_audio(audio_bytes: bytes, ext: str = ".mp3", sr: int = 16000) -> DecodedAudio:
+    """Decode clip bytes in memory to a mono float32 signal at `sr`.
+
+    soundfile reads WAV/FLAC/OGG/MP3 straight from a buffer; anything else goes
+    through `_ffmpeg_decode`. Mixdown and resampling use the same calls as
+    `librosa.load`, so the signal matches what the old tempfile path produced.
+    """
+    try:
+        with sf.SoundFile(io.BytesIO(audio_bytes)) as f:
+            native_sr = f.samplerate
+            audio_signal = f.read(dtype="float32", always_2d=False).T
+    except sf.SoundFileRuntimeError:
+        audio_signal, native_sr = _ffmpeg_decode(audio_bytes, ext)
+
+    audio_signal = librosa.to_mono(audio_signal)
+    audio_signal = librosa.resample(audio_signal, orig_sr=native_sr, target_sr=sr, res_type="soxr_hq")
+    return DecodedAudio(audio_signal, sr, audio_signal.shape[-1] / float(sr))
+
+
+def mfcc_fingerprint(audio_signal: np.ndarray, sample_rate: int) -> np.ndarray:
+    """MFCC mean and standard deviation (40-dim) of an already-decoded signal."""
+
+    # MFCC shape: (n_mfcc, time_frames)
+    mfcc_features = librosa.feature.mfcc(y=audio_signal, sr=sample_rate, n_mfcc=20)
+
+    feature_vector = np.concatenate(
+        [mfcc_features.mean(axis=1), mfcc_features.std(axis=1)],
+        axis=0
+    )
+
+    return feature_vector.astype(np.float32)
+
+
+def extract_mfcc_features(audio_bytes: bytes, ext: str = ".mp3", sr: int = 16000) -> np.ndarray:
+    """Generate a compact audio fingerprint using MFCC mean and standard deviation (40-dim)."""
+    decoded = decode_audio(audio_bytes, ext=ext, sr=sr)
+    return mfcc_fingerprint(decoded.signal, decoded.sample_rate)
+
+
+def decode_and_extract(audio_bytes: bytes, ext: str) -> tuple[Optional[np.ndarray], Optional[str]]:
+    """Decode a clip and fingerprint it, skipping clips shorter than MIN_CLIP_SECONDS.
+
+    Returns (features, None) or (None, error message).
+    """
+    decoded = decode_audio(audio_bytes, ext=ext)
+    if decoded.duration < MIN_CLIP_SECONDS:
+        return None, f"clip too short ({decoded.duration:.2f}s < {MIN_CLIP_SECONDS}s)"
+    return mfcc_fingerprint(decoded.signal, decoded.sample_rate), None
+
+
+def anomaly_score(feat: np.ndarray, mean: np.ndarray, std: np.ndarray) -> float:
+    """Calculate anomaly score using z-score distance mapped to a 0–100 range."""
+
+    z_scores = np.abs((feat - mean) / (std + 1e-6))
+    avg_distance = float(np.mean(z_scores))
+
+    score = min(100.0, avg_distance * 20.0)
+    return score
+
+
+def anomaly_scores(feats: np.ndarray, mean: np.ndarray, std: np.ndarray) -> np.ndarray:
+    """Vectorized `anomaly_score` for a (N, 40) feature matrix; returns N scores."""
+
+    z_scores = np.abs((feats - mean) / (std + 1e-6))
+    return np.minimum(100.0, z_scores.mean(axis=1) * 20.0)
+
+
+def warm_worker() -> None:
+    """Process-pool initializer: import librosa and run one tiny MFCC so numba/FFT setup happens before real work."""
+    librosa.feature.mfcc(y=np.zeros(16000, dtype=np.float32), sr=16000, n_mfcc=20)
+
+
+def extract_batch(items: list[tuple[bytes, str]]) -> list[tuple[Optional[np.ndarray], Optional[str]]]:
+    """Fingerprint a batch of (audio bytes, extension) in a pool worker; errors are returned per clip."""
+    out: list[tuple[Optional[np.ndarray], Optional[str]]] = []
+    for audio_bytes, ext in items:
+        try:
+            out.append(decode_and_extract(audio_bytes, ext))
+        except Exception as e:
+            out.append((None, f"decode failed: {e}"))
+    return out
+
+
+def _ffmpeg_blocks(fileobj: IO[bytes], ext: str, sr: int, block_samples: int) -> Iterator[np.ndarray]:
+    """Stream-decode with ffmpeg (mono, resampled to `sr`), yielding float32 chunks of `block_samples`.
+
+    The input is copied to a temp file first because MP4 containers may need
+    seeking; decoded audio is read from stdout chunk by chunk. A watchdog kills
+    ffmpeg after FFMPEG_TIMEOUT_S, and a timeout or non-zero exit raises with
+    ffmpeg's stderr rather than ending the stream early.
+    """
+    with tempfile.NamedTemporaryFile(suffix=ext, delete=True) as temp_file, tempfile.TemporaryFile() as err_file:
+        shutil.copyfileobj(fileobj, temp_file)
+        temp_file.flush()
+        proc = subprocess.Popen(
+            [
+                "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+                "-i", temp_file.name,
+                "-vn", "-ac", "1", "-ar", str(sr), "-f", "f32le", "pipe:1",
+            ],
+            stdout=subprocess.PIPE,
+            stderr=err_file,  # a file, not a pipe, so a chatty ffmpeg can't block on it
+        )
+        timed_out = threading.Event()
+
+        def _kill():
+            timed_out.set()
+            proc.kill()
+
+        watchdog = threading.Timer(FFMPEG_TIMEOUT_S, _kill)
+        watchdog.start()
+        try:
+            block_bytes = block_samples * 4
+            while True:
+                chunk = proc.stdout.read(block_bytes)
+                if not chunk:
+                    break
+                yield np.frombuffer(chunk[: len(chunk) - len(chunk) % 4], dtype=np.float32)
+            returncode = proc.wait()
+        finally:
+            watchdog.cancel()
+            proc.kill()
+            proc.wait()
+
+        if timed_out.is_set():
+            raise RuntimeError(f"ffmpeg decode timed out after {FFMPEG_TIMEOUT_S:g}s")
+        if returncode != 0:
+            err_file.seek(0)
+            raise RuntimeError(f"ffmpeg decode failed: {err_file.read().decode(errors='ignore').strip()[:200]}")
+
+
+def iter_audio_blocks(fileobj: IO[bytes], ext: str = ".mp3", sr: int = 16000, block_seconds: float = 5.0) -> Iterator[np.ndarray]:
+    """Yield consecutive mono float32 blocks of `block_seconds` at `sr` without decoding the whole file.
+
+    soundfile formats are read block by block and resampled with a streaming
+    soxr resampler (same HQ quality as `decode_audio`); other formats are
+    decoded by ffmpeg. Only about one block is held in memory at a time.
+    """
+    out_len = max(1, int(round(block_seconds * sr)))
+    pending = np.zeros(0, dtype=np.float32)
+
+    try:
+        sf_file = sf.SoundFile(fileobj)
+    except sf.SoundFileRuntimeError:
+        fileobj.seek(0)
+        for chunk in _ffmpeg_blocks(fileobj, ext, sr, out_len):
+            pending = np.concatenate([pending, chunk])
+            while len(pending) >= out_len:
+                yield pending[:out_len]
+                pending = pending[out_len:]
+        if len(pending):
+            yield pending
+        return
+
+    with sf_file:
+        native_sr = sf_file.samplerate
+        resampler = None
+        if native_sr != sr:
+            resampler = soxr.ResampleStream(native_sr, sr, 1, dtype="float32", quality="HQ")
+        in_block = max(1, int(round(block_seconds * native_sr)))
+        for block in sf_file.blocks(blocksize=in_block, dtype="float32", always_2d=True):
+            mono = block.mean(axis=1)
+            if resampler is not None:
+                mono = resampler.resample_chunk(mono, last=False)
+            pending = np.concatenate([pending, mono])
+            while len(pending) >= out_len:
+                yield pending[:out_len]
+                pending = pending[out_len:]
+        if resampler is not None:
+            pending = np.concatenate([pending, resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)])
+    if len(pending):
+        yield pending
+
+
+def score_windows(
+    fileobj: IO[bytes],
+    ext: str,
+    mean: np.ndarray,
+    std: np.ndarray,
+    window_seconds: float = 5.0,
+    sr: int = 16000,
+) -> list[tuple[float, float, float]]:
+    """Score each fixed-length window of a recording against a baseline.
+
+    Returns (start_s, end_s, score) per window. A trailing window shorter than
+    MIN_CLIP_SECONDS is dropped.
+    """
+    timeline: list[tuple[float, float, float]] = []
+    start = 0.0
+    for block in iter_audio_blocks(fileobj, ext=ext, sr=sr, block_seconds=window_seconds):
+        length = len(block) / float(sr)
+        if length >= MIN_CLIP_SECONDS:
+            score = anomaly_score(mfcc_fingerprint(block, sr), mean, std)
+            timeline.append((start, start + length, score))
+        start += length
+    return timeline
@@ -0,0 +1,226 @@
+"""Deterministic parser for simple checklist verdicts ("tires pass", "seat belt fail, torn webbing",
+"tires fail because of a cut sidewall").
+
+parse_command returns an AnalyzeResponse-shaped dict when every clause in the
+utterance maps confidently to one checklist item and one status, and None
+otherwise (the caller then asks the model).
+"""
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Optional
+import re
+
+# Multi-word phrases first; matching is on whole words of the normalized text.
+STATUS_SYNONYMS: dict[str, tuple[str, ...]] = {
+    "PASS": (
+        "no issues", "no problems", "no damage", "looks good", "all good", "in good condition",
+        "pass", "passed", "passes", "passing", "good", "ok", "okay", "fine", "acceptable",
+    ),
+    "MONITOR": (
+        "keep an eye on", "keep an eye", "needs monitoring", "check again", "recheck",
+        "monitor", "monitoring", "watch", "marginal", "borderline",
+    ),
+    "FAIL": (
+        "not ok", "not okay", "no good", "needs repair", "needs replacement", "needs replacing",
+        "fail", "failed", "fails", "failing", "bad", "broken", "unsafe", "damaged",
+    ),
+}
+
+# Item phrases must clear this score, and beat the runner-up by FAST_PATH_MARGIN.
+FAST_PATH_MIN_SCORE = 0.8
+FAST_PATH_MARGIN = 0.08
+
+_WAKE_WORD = re.compile(r"^(hey|hi|ok|okay)\s+cat\b[\s,]*")
+_QUESTION = re.compile(r"^(what|why|how|when|where|which|who|should|can|could|does|do|is|are|will|would)\b")
+_NEGATION = {"not", "no", "never", "dont", "doesnt", "isnt", "arent", "didnt", "wont", "cant"}
+_FILLER = {"mark", "set", "the", "a", "an", "is", "are", "as", "to", "it", "its", "item", "status", "looks", "look", "and", "on", "for", "all"}
+_CLAUSE_SPLIT = re.compile(r"\s*(?:[,;.]|\band\b)\s*")
+_NOTE_LEAD = re.compile(r"^(?:[,;:.\-]|\band\b|\bbecause(?: of)?\b|\bdue to\b|\bbut\b|\s)+")
+
+_STATUS_RE = re.compile(
+    r"\b("
+    + "|".join(
+        re.escape(p)
+        for p in sorted((p for ps in STATUS_SYNONYMS.values() for p in ps), key=len, reverse=True)
+    )
+    + r")\b"
+)
+_STATUS_OF = {p: status for status, ps in STATUS_SYNONYMS.items() for p in ps}
+
+
+def _normalize(text: str) -> str:
+    t = re.sub(r"['’]", "", (text or "").lower())
+    t = re.sub(r"[^a-z0-9,;.:\-/ ]+", " ", t)
+    return _WAKE_WORD.sub("", " ".join(t.split())).strip(" .")
+
+
+def _stem_words(text: str) -> list[str]:
+    """Content words with a naive plural strip ("tires" ~ "tire")."""
+    words = re.findall(r"[a-z0-9]+", text)
+    return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words if w not in _FILLER]
+
+
+def normalize_item(text: str) -> str:
+    """Canonical form of an item name for lookups: lowercase content words, plurals stripped."""
+    return " ".join(_stem_words((text or "").lower()))
+
+
+@lru_cache(maxsize=32)
+def _item_index(keys: tuple[str, ...]) -> tuple[list[tuple[str, str, float]], dict[str, list[tuple[str, float]]]]:
+    """(match string, checklist key, weight) for each full name and each component of a
+    compound name, plus the same entries grouped by match string for exact lookups."""
+    index: list[tuple[str, str, float]] = []
+    for key in keys:
+        full = normalize_item(key)
+        index.append((full, key, 1.0))
+        parts = re.split(r",|/|\band\b", key.lower())
+        if len(parts) > 1:
+            for part in parts:
+                alias = normalize_item(part)
+                if alias and alias != full:
+                    index.append((alias, key, 0.95))
+    exact: dict[str, list[tuple[str, float]]] = {}
+    for alias, key, weight in index:
+        exact.setdefault(alias, []).append((key, weight))
+    return index, exact
+
+
+@lru_cache(maxsize=4096)
+def match_item(phrase: str, keys: tuple[str, ...]) -> tuple[Optional[str], float]:
+    """Best checklist key for `phrase` and its score; (None, score) if ambiguous or weak."""
+    target = normalize_item(phrase)
+    if not target:
+        return None, 0.0
+    index, exact = _item_index(keys)
+
+    best: dict[str, float] = {}
+    if target in exact:
+        for key, weight in exact[target]:
+            best[key] = max(best.get(key, 0.0), weight)
+    else:
+        for alias, key, weight in index:
+            matcher = SequenceMatcher(None, target, alias)
+            # quick_ratio is an upper bound on ratio; skip hopeless candidates cheaply
+            if weight * 0.9 * matcher.quick_ratio() < FAST_PATH_MIN_SCORE:
+                continue
+            score = weight * 0.9 * matcher.ratio()
+            if score > best.get(key, 0.0):
+                best[key] = score
+    if not best:
+        return None, 0.0
+    ranked = sorted(best.items(), key=lambda kv: -kv[1])
+    top_key, top = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+    if top < FAST_PATH_MIN_SCORE or (top < 1.0 and top - runner_up < FAST_PATH_MARGIN):
+        return None, top
+    return top_key, top
+
+
+def _note_is_safe(status: str, note: str, keys: tuple[str, ...]) -> bool:
+    """Whether free text after a verdict can ride along as its note.
+
+    Anything after a PASS ("tires good but the left rear is flat") may be a
+    defect, and a note naming another item ("mirrors fail, windshield
+    cracked") carries a second verdict; both go to the model.
+    """
+    words = _stem_words(note)
+    if not words:
+        return True
+    if status == "PASS":
+        return False
+    _, exact = _item_index(keys)
+    for size in (1, 2, 3):
+        for j in range(len(words) - size + 1):
+            if " ".join(words[j:j + size]) in exact:
+                return False
+    return True
+
+
+# Risk for an update, by its worst status (same scale the model assigns)
+_RISK_OF_STATUS = {"FAIL": "High", "MONITOR": "Moderate", "PASS": "Low"}
+
+
+def parse_command(text: str, keys: list[str]) -> Optional[dict]:
+    """Parse a verdict command into an AnalyzeResponse dict, or None if the model should handle it."""
+    raw = (text or "").strip()
+    t = _normalize(raw)
+    if not t or raw.endswith("?") or _QUESTION.match(t):
+        return None
+
+    matches = list(_STATUS_RE.finditer(t))
+    if not matches:
+        return None
+
+    key_tuple = tuple(keys)
+    updates: dict[str, dict] = {}
+    pending_note_start = 0
+    prev_key: Optional[str] = None
+    for i, m in enumerate(matches):
+        before = t[:m.start()].split()
+        if before and before[-1] in _NEGATION:
+            return None
+
+        # Item phrase: the last clause chunk before the status word. Earlier
+        # chunks are the previous item's note (or, for the first item, filler).
+        chunks = [c for c in _CLAUSE_SPLIT.split(t[pending_note_start:m.start()]) if c.strip()]
+        status_first = False
+        if not chunks:
+            if i > 0:
+                return None
+            # "fail seat belt, torn webbing": item follows the status word
+            tail = [c for c in _CLAUSE_SPLIT.split(t[m.end():]) if c.strip()]
+            if not tail:
+                return None
+            chunks = [tail[0]]
+            status_first = True
+
+        # Names like "Lights, front and rear" span chunks: widen until one
+        # matches. The first item has no earlier note, so it must use them all.
+        key, item_phrase, n = None, "", 0
+        for n in range(1 if i > 0 else len(chunks), len(chunks) + 1):
+            item_phrase = " ".join(chunks[-n:])
+            if len(_stem_words(item_phrase)) > 6:
+                break
+            key, _ = match_item(item_phrase, key_tuple)
+            if key is not None:
+                break
+        if key is None or key in updates:
+            return None
+        if i > 0:
+            note = _NOTE_LEAD.sub("", ", ".join(chunks[:-n])).strip(" .")
+            if note:
+                if not _note_is_safe(updates[prev_key]["status"], note, key_tuple):
+                    return None
+                updates[prev_key]["note"] = note
+
+        updates[key] = {"status": _STATUS_OF[m.group(1)], "note": None}
+        prev_key = key
+
+        if status_first:
+            start = t.find(chunks[0], m.end()) + len(chunks[0])
+        else:
+            start = m.end()
+        pending_note_start = start
+
+    note = _NOTE_LEAD.sub("", t[pending_note_start:]).strip(" .")
+    if note:
+        if not _note_is_safe(updates[prev_key]["status"], note, key_tuple):
+            return None
+        updates[prev_key]["note"] = note
+
+    follow_ups = [
+        f"What did you observe on {key}?"
+        for key, upd in updates.items()
+        if upd["status"] != "PASS" and not upd["note"]
+    ]
+    summary = "; ".join(f"{key}: {upd['status']}" for key, upd in updates.items())
+    statuses = {upd["status"] for upd in updates.values()}
+    risk = next(_RISK_OF_STATUS[s] for s in ("FAIL", "MONITOR", "PASS") if s in statuses)
+    return {
+        "intent": "inspection_update",
+        "checklist_updates": updates,
+        "update_reasoning": {},
+        "risk_score": risk,
+        "answer": f"Updated {summary}.",
+        "follow_up_questions": follow_ups,
+    }
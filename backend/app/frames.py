@@ -0,0 +1,236 @@
+"""Frame preprocessing for the vision calls: decode once, downscale, re-encode, drop near-duplicates.
+
+Also keyframe selection for uploaded videos (ffmpeg decodes, Pillow scores).
+Pillow is optional for still frames; without it they are forwarded unchanged.
+"""
+from typing import Optional
+import base64
+import heapq
+import io
+import os
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+# Longest edge (px) sent to the vision model; larger frames are downscaled.
+FRAME_MAX_EDGE = int(os.getenv("FRAME_MAX_EDGE", "1024"))
+FRAME_JPEG_QUALITY = int(os.getenv("FRAME_JPEG_QUALITY", "80"))
+# Frames whose 64-bit dHash differs from an already kept frame by at most this
+# many bits are treated as duplicates.
+FRAME_DEDUP_DISTANCE = int(os.getenv("FRAME_DEDUP_DISTANCE", "5"))
+
+
+def _strip_data_url(frame: str) -> str:
+    return frame.split(",", 1)[1] if frame.startswith("data:") else frame
+
+
+def dhash(img: "Image.Image", size: int = 8) -> int:
+    """64-bit difference hash: grayscale, shrink to (size+1, size), compare neighbours."""
+    small = img.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR)
+    px = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = px[row * (size + 1) + col]
+            right = px[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return bits
+
+
+def preprocess_frames(
+    frames: list[str],
+    max_edge: int = FRAME_MAX_EDGE,
+    quality: int = FRAME_JPEG_QUALITY,
+    dedup_distance: int = FRAME_DEDUP_DISTANCE,
+) -> tuple[list[str], dict]:
+    """Downscale, re-encode and de-duplicate base64 JPEG frames.
+
+    Returns (frames to send, stats). Frames that fail to decode are passed
+    through untouched, so the model still sees them.
+    """
+    stats = {
+        "frames_in": len(frames),
+        "frames_out": 0,
+        "duplicates_dropped": 0,
+        "bytes_in": 0,
+        "bytes_out": 0,
+        "bytes_saved": 0,
+        "preprocessed": Image is not None,
+    }
+    out: list[str] = []
+    kept_hashes: list[int] = []
+
+    for frame in frames:
+        b64 = _strip_data_url(frame)
+        raw: Optional[bytes] = None
+        try:
+            raw = base64.b64decode(b64, validate=False)
+        except Exception:
+            pass
+        stats["bytes_in"] += len(raw) if raw is not None else len(b64)
+
+        if Image is None or raw is None:
+            out.append(b64)
+            stats["bytes_out"] += len(raw) if raw is not None else len(b64)
+            continue
+
+        try:
+            img = ImageOps.exif_transpose(Image.open(io.BytesIO(raw)))
+            img = img.convert("RGB")
+        except Exception:
+            out.append(b64)
+            stats["bytes_out"] += len(raw)
+            continue
+
+        h = dhash(img)
+        if any((h ^ kept).bit_count() <= dedup_distance for kept in kept_hashes):
+            stats["duplicates_dropped"] += 1
+            continue
+        kept_hashes.append(h)
+
+        resized = max(img.size) > max_edge
+        if resized:
+            img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+        encoded = buf.getvalue()
+        # Re-encoding an already small JPEG can make it bigger; keep the original then
+        if not resized and len(encoded) >= len(raw):
+            encoded = raw
+
+        out.append(base64.b64encode(encoded).decode("ascii"))
+        stats["bytes_out"] += len(encoded)
+
+    stats["frames_out"] = len(out)
+    stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+    return out, stats
+
+
+# Keyframe selection: frames are sampled at VIDEO_SAMPLE_FPS, scaled to at most
+# VIDEO_DECODE_EDGE wide, and only the first VIDEO_MAX_SECONDS are decoded.
+# ffmpeg is killed after VIDEO_DECODE_TIMEOUT_S. At most KEYFRAME_POOL_FACTOR *
+# top_k candidate frames are held in memory at any time.
+VIDEO_SAMPLE_FPS = float(os.getenv("VIDEO_SAMPLE_FPS", "2"))
+VIDEO_DECODE_EDGE = int(os.getenv("VIDEO_DECODE_EDGE", "1024"))
+VIDEO_MAX_SECONDS = float(os.getenv("VIDEO_MAX_SECONDS", "90"))
+VIDEO_DECODE_TIMEOUT_S = float(os.getenv("VIDEO_DECODE_TIMEOUT_S", "45"))
+KEYFRAME_POOL_FACTOR = 4
+# Minimum dHash distance (bits) between selected keyframes
+KEYFRAME_NOVELTY_BITS = int(os.getenv("KEYFRAME_NOVELTY_BITS", "10"))
+
+
+def sharpness(img: "Image.Image") -> float:
+    """Variance of the Laplacian on a 256-px-wide grayscale copy (higher = sharper)."""
+    gray = img.convert("L")
+    if gray.width > 256:
+        gray = gray.resize((256, max(1, round(gray.height * 256 / gray.width))), Image.Resampling.BILINEAR)
+    g = np.asarray(gray, dtype=np.float32)
+    if g.shape[0] < 3 or g.shape[1] < 3:
+        return 0.0
+    lap = (
+        g[:-2, 1:-1] + g[2:, 1:-1] + g[1:-1, :-2] + g[1:-1, 2:]
+        - 4.0 * g[1:-1, 1:-1]
+    )
+    return float(lap.var())
+
+
+def _iter_mjpeg(stream, chunk_size: int = 1 << 16):
+    """Split an ffmpeg image2pipe MJPEG stream into individual JPEG byte strings."""
+    buf = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        buf += chunk
+        while True:
+            start = buf.find(b"\xff\xd8")
+            end = buf.find(b"\xff\xd9", start + 2) if start >= 0 else -1
+            if start < 0 or end < 0:
+                break
+            yield buf[start:end + 2]
+            buf = buf[end + 2:]
+
+
+def select_keyframes(video_path: str, top_k: int = 4) -> tuple[list[str], dict]:
+    """Decode a video at a fixed stride and return the top_k sharpest, mutually distinct frames.
+
+    Returns (base64 JPEG frames in time order, stats).
+    """
+    if Image is None:
+        raise RuntimeError("Pillow is required for video keyframe selection")
+
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [
+            "ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+            "-t", str(VIDEO_MAX_SECONDS), "-i", video_path,
+            "-an", "-vf", f"fps={VIDEO_SAMPLE_FPS},scale='min({VIDEO_DECODE_EDGE},iw)':-2",
+            "-f", "image2pipe", "-c:v", "mjpeg", "-q:v", "3", "pipe:1",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    timed_out = threading.Event()
+
+    def _kill():
+        timed_out.set()
+        proc.kill()
+
+    watchdog = threading.Timer(VIDEO_DECODE_TIMEOUT_S, _kill)
+    watchdog.start()
+
+    pool_size = max(top_k, top_k * KEYFRAME_POOL_FACTOR)
+    candidates: list[tuple[float, int, bytes, int]] = []  # min-heap of (sharpness, index, jpeg, dhash)
+    decoded = 0
+    try:
+        for index, jpeg in enumerate(_iter_mjpeg(proc.stdout)):
+            try:
+                img = Image.open(io.BytesIO(jpeg))
+                img.load()
+            except Exception:
+                continue
+            decoded += 1
+            entry = (sharpness(img), index, jpeg, dhash(img))
+            if len(candidates) < pool_size:
+                heapq.heappush(candidates, entry)
+            elif entry[0] > candidates[0][0]:
+                heapq.heapreplace(candidates, entry)
+    finally:
+        watchdog.cancel()
+        proc.kill()
+        proc.wait()
+
+    # Greedy pick: sharpest first, skipping frames too similar to one already chosen
+    ranked = sorted(candidates, key=lambda c: c[0], reverse=True)
+    chosen: list[tuple[float, int, bytes, int]] = []
+    for cand in ranked:
+        if len(chosen) >= top_k:
+            break
+        if all((cand[3] ^ c[3]).bit_count() > KEYFRAME_NOVELTY_BITS for c in chosen):
+            chosen.append(cand)
+    # Not enough distinct frames: top up with the sharpest remaining ones
+    for cand in ranked:
+        if len(chosen) >= top_k:
+            break
+        if cand not in chosen:
+            chosen.append(cand)
+    chosen.sort(key=lambda c: c[1])
+
+    stats = {
+        "frames_decoded": decoded,
+        "candidates": len(candidates),
+        "selected": len(chosen),
+        "timestamps_s": [round(c[1] / VIDEO_SAMPLE_FPS, 2) for c in chosen],
+        "sharpness": [round(c[0], 1) for c in chosen],
+        "decode_ms": round((time.perf_counter() - t0) * 1000.0, 1),
+        "timed_out": timed_out.is_set(),
+    }
+    return [base64.b64encode(c[2]).decode("ascii") for c in chosen], stats
@@ -1,17 +1,43 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, List, Optional, Literal
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Dict, List, NamedTuple, Optional, Literal
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from collections import OrderedDict
+from datetime import datetime, timezone
 import os
+import re
+import copy
+import zlib
 import json
 import io
+import time
+import random
+import hashlib
+import sqlite3
+import threading
+import asyncio
+import httpx
 import requests
-import numpy as np
-import librosa
+import multiprocessing
 import tempfile
-from openai import OpenAI
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import openai
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
-from supabase import create_client
+from supabase import create_client, acreate_client, AsyncClient
+from postgrest.exceptions import APIError
+
+from .commands import match_item, normalize_item, parse_command
+from .frames import preprocess_frames, select_keyframes
+from .memory_index import (
+    MEMORY_INDEX_DIM, MEMORY_INDEX_DIR, MEMORY_INDEX_MAX_ITEMS, MEMORY_INDEX_MAX_PARTITIONS, MEMORY_INDEX_MIN_SCORE,
+    MemoryIndex,
+)
+from .audio import anomaly_score, anomaly_scores, extract_batch, score_windows, warm_worker
 
 # Supermemory (optional)
 try:
@@ -49,6 +75,8 @@ class AnalyzeResponse(BaseModel):
 
 class GenerateReportRequest(BaseModel):
     inspection_id: str
+    # Regenerate even if the stored report matches the current checklist
+    force_refresh: bool = False
 
 # COMPLETE_INSPECTION_CHECKLIST constant
 COMPLETE_INSPECTION_CHECKLIST = {
@@ -100,21 +128,148 @@ COMPLETE_INSPECTION_CHECKLIST = {
     },
 }
 
+# -----------------------------
+# Checklist registry
+# -----------------------------
+
+# Checklist templates, compiled once at startup. The wheel loader checklist
+# above is built in; CHECKLIST_TEMPLATES_PATH may point at a JSON file of
+# {"template_name": {"models": ["CAT 950 GC", ...], "sections": {...}}} to add
+# others. Machine models without a template use DEFAULT_CHECKLIST_TEMPLATE.
+CHECKLIST_TEMPLATES_PATH = os.getenv("CHECKLIST_TEMPLATES_PATH")
+DEFAULT_CHECKLIST_TEMPLATE = os.getenv("DEFAULT_CHECKLIST_TEMPLATE", "wheel_loader")
+
+
+class ChecklistTemplate:
+    """One checklist with its lookup structures: ordered keys, a frozenset for
+    validation, and normalized-name / alias dicts for resolving near-miss names."""
+
+    def __init__(self, name: str, sections: Dict[str, Dict[str, str]]):
+        self.name = name
+        self.sections = sections
+        self.keys: tuple[str, ...] = tuple(k for items in sections.values() for k in items)
+        self.key_set = frozenset(self.keys)
+        self.section_of = {k: section for section, items in sections.items() for k in items}
+        self.by_normalized = {normalize_item(k): k for k in self.keys}
+        # Components of compound names ("Seat belt and mounting" -> "seat belt").
+        # Components shared by several items ("hoses") are ambiguous and left out.
+        owners: dict[str, set[str]] = {}
+        for key in self.keys:
+            for part in re.split(r",|/|\band\b", key):
+                alias = normalize_item(part)
+                if alias:
+                    owners.setdefault(alias, set()).add(key)
+        self.by_alias = {
+            alias: next(iter(keys))
+            for alias, keys in owners.items()
+            if len(keys) == 1 and alias not in self.by_normalized
+        }
+
+    def empty_state(self) -> Dict[str, str]:
+        return {k: "none" for k in self.keys}
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Canonical key for an item name the model (or a client) produced, or None."""
+        if name in self.key_set:
+            return name
+        norm = normalize_item(name)
+        key = self.by_normalized.get(norm) or self.by_alias.get(norm)
+        if key is None:
+            # Typos: memoized difflib match, refuses ambiguous names
+            key, _ = match_item(name, self.keys)
+        return key
+
+
+class ChecklistRegistry:
+    def __init__(self, default: str):
+        self.default = default
+        self.templates: dict[str, ChecklistTemplate] = {}
+        self._by_model: dict[str, ChecklistTemplate] = {}
+
+    def register(self, name: str, sections: Dict[str, Dict[str, str]], models: list[str] = ()) -> ChecklistTemplate:
+        template = ChecklistTemplate(name, sections)
+        self.templates[name] = template
+        for model in [name, *models]:
+            self._by_model[model.strip().lower()] = template
+        return template
+
+    def load_file(self, path: str) -> None:
+        with open(path) as f:
+            spec = json.load(f)
+        for name, entry in spec.items():
+            self.register(name, entry["sections"], entry.get("models", []))
+
+    def for_model(self, machine_model: Optional[str]) -> ChecklistTemplate:
+        if machine_model:
+            template = self._by_model.get(machine_model.strip().lower())
+            if template is not None:
+                return template
+        return self.templates[self.default]
+
+
+checklist_registry = ChecklistRegistry(DEFAULT_CHECKLIST_TEMPLATE)
+checklist_registry.register("wheel_loader", COMPLETE_INSPECTION_CHECKLIST)
+if CHECKLIST_TEMPLATES_PATH:
+    checklist_registry.load_file(CHECKLIST_TEMPLATES_PATH)
+
+
 # Helper to flatten keys
-def get_flat_checklist_keys():
-    keys = []
-    for checklist_section in FULL_CHECKLIST.values():
-        keys.extend(checklist_section.keys())
-    return keys
-app = FastAPI()
+def get_flat_checklist_keys(machine_model: Optional[str] = None) -> list[str]:
+    return list(checklist_registry.for_model(machine_model).keys)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create the async Supabase client on startup and close pooled connections on shutdown."""
+    global asupabase
+    asupabase = await acreate_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    await check_checklist_schema()
+    sound_pool.start()
+    if TRANSCRIBE_WORKER_ENABLED and await transcription_worker.schema_ready():
+        transcription_worker.start()
+    write_outbox.start()
+    try:
+        yield
+    finally:
+        await write_outbox.stop()
+        await transcription_worker.stop()
+        sound_pool.shutdown()
+        await http_client.aclose()
+        await aclient.close()
+
+
+app = FastAPI(lifespan=lifespan)
 load_dotenv()
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Async engine for the hot request path (/analyze, /voice-analyze, /analyze-video-command).
+# Sync endpoints keep using `client` / `supabase`; FastAPI runs those in its threadpool.
+aclient = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 SUPABASE_BUCKET = os.getenv("SUPABASE_BUCKET", "media")
 
 TRANSCRIBE_MODEL = os.getenv("TRANSCRIBE_MODEL", "gpt-4o-mini-transcribe")
 
+# Concurrency limit for model calls on one worker. Requests beyond this many
+# in-flight inspections wait on the semaphore instead of piling onto OpenAI;
+# the event loop itself stays free, so one uvicorn worker can hold dozens of
+# Assist-mode commands open at once. Tune with INSPECTION_CONCURRENCY.
+INSPECTION_CONCURRENCY = int(os.getenv("INSPECTION_CONCURRENCY", "32"))
+_inspection_slots = asyncio.Semaphore(INSPECTION_CONCURRENCY)
+
+# Shared keep-alive HTTP client for async downloads (Supabase storage etc.)
+http_client = httpx.AsyncClient(
+    timeout=60,
+    limits=httpx.Limits(
+        max_connections=INSPECTION_CONCURRENCY,
+        max_keepalive_connections=INSPECTION_CONCURRENCY,
+    ),
+)
+
+
+def _ms_since(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000.0, 1)
+
 # --- Supermemory setup (safe/no-op if not configured) ---
 SUPERMEMORY_API_KEY = os.getenv("SUPERMEMORY_API_KEY")
 sm_client = None
@@ -132,7 +287,7 @@ if Supermemory and SUPERMEMORY_API_KEY:
 
 from typing import Optional, List, Any
 
-def sm_add_memory(content: str, tags: List[str], debug: bool = True) -> Optional[Any]:
+def sm_add_memory(content: str, tags: List[str], debug: bool = True, raise_errors: bool = False) -> Optional[Any]:
     """
     Save a memory snippet to Supermemory.
 
@@ -140,6 +295,7 @@ def sm_add_memory(content: str, tags: List[str], debug: bool = True) -> Optional
         content (str): The memory content to store
         tags (List[str]): Tags for organizing memory
         debug (bool): Enable debug logging
+        raise_errors (bool): Re-raise SDK errors instead of returning None
 
     Returns:
         Optional[Any]: Result from Supermemory or None if failed
@@ -164,9 +320,11 @@ def sm_add_memory(content: str, tags: List[str], debug: bool = True) -> Optional
     except Exception as error:
         if debug:
             print("❌ Supermemory add failed:", str(error))
+        if raise_errors:
+            raise
         return None
 
-def sm_search_memory(query: str, tags: list[str], k: int = 5) -> list[str]:
+def sm_search_memory(query: str, tags: list[str], k: int = 5, raise_errors: bool = False) -> list[str]:
     """Search memory snippets. Safe no-op if not configured.
 
     The Supermemory SDK can return different shapes depending on version:
@@ -246,10 +404,42 @@ def sm_search_memory(query: str, tags: list[str], k: int = 5) -> list[str]:
         return deduped
 
     except Exception as e:
+        if raise_errors:
+            raise
         print("Supermemory search failed:", e)
         return []
 
 
+# Memory backend for history lookups: "local" searches the embedded vector
+# index (app/memory_index.py), "supermemory" the remote service. Writes always
+# go to the local index, and to Supermemory too when it is configured.
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "supermemory" if SUPERMEMORY_API_KEY else "local").lower()
+
+local_memory = MemoryIndex(
+    MEMORY_INDEX_DIR, MEMORY_INDEX_DIM, MEMORY_INDEX_MAX_ITEMS, MEMORY_INDEX_MAX_PARTITIONS, MEMORY_INDEX_MIN_SCORE
+)
+
+
+def memory_add(content: str, tags: list[str], key: Optional[str] = None, raise_errors: bool = False) -> None:
+    """Store a memory under each tag locally (`key` replaces an earlier entry) and in Supermemory if configured."""
+    for tag in tags:
+        try:
+            local_memory.add(tag, content, key=key)
+        except Exception as e:
+            print("Local memory add failed:", e)
+            if raise_errors:
+                raise
+    if sm_client:
+        sm_add_memory(content, tags, raise_errors=raise_errors)
+
+
+def memory_search(query: str, tags: list[str], k: int = 5) -> list[str]:
+    """Search memory with the configured backend."""
+    if MEMORY_BACKEND == "local":
+        return local_memory.search(query, tags, k=k)
+    return sm_search_memory(query, tags, k=k)
+
+
 def _machine_tags(machine_id: str, inspection_id: str | None = None) -> list[str]:
     # IMPORTANT: Supermemory containerTags use exact array matching.
     # To keep retrieval reliable, we use a single partition tag per machine.
@@ -259,6 +449,8 @@ if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
     raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in .env")
 
 supabase = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+# Async client, created in `lifespan` (acreate_client must be awaited).
+asupabase: Optional[AsyncClient] = None
 
 app.add_middleware(
     CORSMiddleware,
@@ -275,16 +467,14 @@ def start_inspection(machine_model: str):
     """
 
     try:
-        # 1. Build initial checklist state
-        initial_state = {}
-        for section in FULL_CHECKLIST.values():
-            initial_state.update(section)
+        # 1. Build initial checklist state from the model's template
+        initial_state = checklist_registry.for_model(machine_model).empty_state()
 
         # 2. Insert into Supabase
         resp = supabase.table("inspections").insert({
             "machine_model": machine_model,
             "checklist_json": initial_state,
-            "created_at": datetime.utcnow().isoformat()
+            "created_at": datetime.now(timezone.utc).isoformat()
         }).execute()
 
         # 3. Validate response
@@ -304,102 +494,658 @@ class AnalyzeVideoCommandRequest(BaseModel):
     frames: Optional[List[str]] = None
 
 @app.post("/analyze-video-command")
-def analyze_video_command(req: AnalyzeVideoCommandRequest):
-    return run_inspection_logic(req.user_text, req.current_checklist_state, req.frames)
+async def analyze_video_command(req: AnalyzeVideoCommandRequest):
+    return await run_inspection_logic(req.user_text, req.current_checklist_state, req.frames)
+
+
+async def _fetch_inspection(inspection_id: str, columns: Optional[str] = None) -> dict:
+    """Load one inspection row through the async Supabase client (404 if missing)."""
+    resp = await (
+        asupabase.table("inspections")
+        .select(columns or f"{_checklist_columns()}, machine_model")
+        .eq("id", inspection_id)
+        .limit(1)
+        .execute()
+    )
+
+    rows = resp.data or []
+    if not rows:
+        raise HTTPException(status_code=404, detail="Inspection not found")
+    if "machine_model" in rows[0]:
+        _remember_machine_id(inspection_id, rows[0].get("machine_model") or "unknown")
+    return rows[0]
+
+
+# inspection_id -> machine_id, so memory lookups can start before the row is loaded.
+_INSPECTION_MACHINE_IDS_MAX = 4096
+_inspection_machine_ids: dict[str, str] = {}
+
+
+def _remember_machine_id(inspection_id: str, machine_id: str) -> None:
+    _inspection_machine_ids.pop(inspection_id, None)
+    _inspection_machine_ids[inspection_id] = machine_id
+    if len(_inspection_machine_ids) > _INSPECTION_MACHINE_IDS_MAX:
+        _inspection_machine_ids.pop(next(iter(_inspection_machine_ids)))
+
+
+# -----------------------------
+# Checklist writes (optimistic concurrency)
+# -----------------------------
+
+# Checklist writes are item-level deltas guarded by inspections.checklist_version
+# (int not null default 0). With the RPC below installed, only the changed
+# items (and the names of removed ones) go over the wire:
+#
+#   alter table inspections add column if not exists checklist_version int not null default 0;
+#
+#   create or replace function apply_checklist_delta(
+#     p_inspection_id uuid, p_delta jsonb, p_expected_version int, p_removed text[] default '{}'
+#   )
+#   returns int language sql as $$
+#     update inspections
+#        set checklist_json = (checklist_json - p_removed) || p_delta,
+#            checklist_version = checklist_version + 1
+#      where id = p_inspection_id and checklist_version = p_expected_version
+#     returning checklist_version;
+#   $$;
+#
+# (Drop the older three-argument version of the function if it is installed.)
+# Without it we fall back to a conditional update of the merged checklist
+# (same version guard). On a version conflict the delta is re-applied against
+# fresh state, up to CHECKLIST_WRITE_MAX_ATTEMPTS times. Until the column
+# exists (checked at startup), writes are plain last-writer-wins updates.
+CHECKLIST_WRITE_MAX_ATTEMPTS = int(os.getenv("CHECKLIST_WRITE_MAX_ATTEMPTS", "5"))
+_checklist_rpc_available = True
+_checklist_versioned = True
+
+
+def _checklist_columns() -> str:
+    return "id, checklist_json, checklist_version" if _checklist_versioned else "id, checklist_json"
+
+
+async def check_checklist_schema() -> bool:
+    """Detect a missing inspections.checklist_version column and switch to unversioned writes."""
+    global _checklist_versioned
+    try:
+        await asupabase.table("inspections").select("id, checklist_version").limit(1).execute()
+    except Exception as e:
+        if isinstance(e, APIError) and e.code == "42703":  # undefined column
+            _checklist_versioned = False
+            print("inspections.checklist_version missing; checklist writes are unversioned until the migration runs")
+        else:
+            # Can't tell (e.g. Supabase unreachable): keep versioned writes
+            print("Checklist schema check failed:", e)
+    return _checklist_versioned
+
+
+async def apply_checklist_delta(
+    inspection_id: str,
+    delta: Dict[str, str],
+    base: Optional[dict] = None,
+    replace: bool = False,
+) -> dict:
+    """Write item-level status changes. `base` is a row with checklist_json/checklist_version, if already loaded.
+
+    With `replace`, `delta` is the whole checklist: stored items missing from it are removed.
+    Returns {"version", "attempts", "changed", "removed"} (changed = items actually written).
+    """
+    global _checklist_rpc_available
+
+    row = base
+    for attempt in range(1, CHECKLIST_WRITE_MAX_ATTEMPTS + 1):
+        if row is None or "checklist_json" not in row or (_checklist_versioned and "checklist_version" not in row):
+            row = await _fetch_inspection(inspection_id, _checklist_columns())
+        current = row.get("checklist_json") or {}
+        version = int(row.get("checklist_version") or 0)
+
+        changed = {k: v for k, v in delta.items() if k not in current or current[k] != v}
+        removed = [k for k in current if k not in delta] if replace else []
+        if not changed and not removed:
+            return {"version": version, "attempts": attempt, "changed": {}, "removed": []}
+        merged = {**{k: v for k, v in current.items() if k not in removed}, **changed}
+
+        if not _checklist_versioned:
+            await asupabase.table("inspections").update({"checklist_json": merged}).eq("id", inspection_id).execute()
+            return {"version": None, "attempts": attempt, "changed": changed, "removed": removed}
+
+        new_version = None
+        if _checklist_rpc_available:
+            try:
+                resp = await asupabase.rpc(
+                    "apply_checklist_delta",
+                    {
+                        "p_inspection_id": inspection_id,
+                        "p_delta": changed,
+                        "p_expected_version": version,
+                        "p_removed": removed,
+                    },
+                ).execute()
+                new_version = resp.data
+            except APIError as e:
+                if e.code != "PGRST202":  # function not found
+                    raise
+                _checklist_rpc_available = False
+        if not _checklist_rpc_available:
+            resp = await (
+                asupabase.table("inspections")
+                .update({"checklist_json": merged, "checklist_version": version + 1})
+                .eq("id", inspection_id)
+                .eq("checklist_version", version)
+                .execute()
+            )
+            new_version = version + 1 if resp.data else None
+
+        if new_version is not None:
+            return {"version": new_version, "attempts": attempt, "changed": changed, "removed": removed}
+
+        # Someone else wrote first: reload and re-apply the delta
+        row = None
+
+    raise HTTPException(status_code=409, detail="Checklist was modified concurrently, please retry")
+
+
+# -----------------------------
+# Memory retrieval budget
+# -----------------------------
+
+# Supermemory search has no timeout of its own, so each lookup gets
+# MEMORY_BUDGET_MS and the model call goes ahead without memory if it runs
+# out. After MEMORY_BREAKER_THRESHOLD consecutive timeouts/errors the breaker
+# opens and memory is skipped outright for MEMORY_BREAKER_COOLDOWN_S, then a
+# single trial lookup decides whether it closes again.
+MEMORY_BUDGET_MS = int(os.getenv("MEMORY_BUDGET_MS", "600"))
+MEMORY_BREAKER_THRESHOLD = int(os.getenv("MEMORY_BREAKER_THRESHOLD", "3"))
+MEMORY_BREAKER_COOLDOWN_S = float(os.getenv("MEMORY_BREAKER_COOLDOWN_S", "30"))
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown_s: float):
+        self.threshold = threshold
+        self.cooldown_s = cooldown_s
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.skipped = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown_s:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        self.skipped += 1
+        return False
+
+    def record_success(self) -> None:
+        self.calls += 1
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self, timeout: bool) -> None:
+        self.calls += 1
+        if timeout:
+            self.timeouts += 1
+        else:
+            self.errors += 1
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "skipped": self.skipped,
+        }
+
+
+memory_breaker = CircuitBreaker(MEMORY_BREAKER_THRESHOLD, MEMORY_BREAKER_COOLDOWN_S)
+
+
+async def _search_memory_async(query: str, tags: list[str], k: int = 5) -> tuple[list[str], Optional[str]]:
+    """Memory search within MEMORY_BUDGET_MS (Supermemory runs off the event loop).
+
+    Returns (hits, skip_reason); skip_reason is None when memory was used
+    (or not configured), else "timeout", "error" or "circuit_open".
+    """
+    if MEMORY_BACKEND == "local":
+        # In-process matrix product, well under the budget
+        try:
+            return local_memory.search(query, tags, k=k), None
+        except Exception as e:
+            print("Local memory search failed:", e)
+            return [], "error"
+    if not sm_client:
+        return [], None
+    if not memory_breaker.allow():
+        return [], "circuit_open"
+    try:
+        # The worker thread can't be cancelled; on timeout we just stop waiting for it.
+        hits = await asyncio.wait_for(
+            asyncio.to_thread(sm_search_memory, query, tags, k, True),
+            timeout=MEMORY_BUDGET_MS / 1000,
+        )
+    except asyncio.TimeoutError:
+        memory_breaker.record_failure(timeout=True)
+        print(f"Supermemory search exceeded {MEMORY_BUDGET_MS}ms budget, continuing without memory")
+        return [], "timeout"
+    except Exception as e:
+        memory_breaker.record_failure(timeout=False)
+        print("Supermemory search failed:", e)
+        return [], "error"
+    memory_breaker.record_success()
+    return hits, None
+
+
+async def _load_inspection_and_memory(inspection_id: str, query: str, k: int = 3) -> tuple[dict, list[str], dict]:
+    """Fetch the inspection row and its memory hits, concurrently when the machine is already known.
+
+    Returns (row, memory_hits, stages_skipped).
+    """
+    machine_id = _inspection_machine_ids.get(inspection_id)
+    if machine_id is not None:
+        row, (mem, skip) = await asyncio.gather(
+            _fetch_inspection(inspection_id),
+            _search_memory_async(query, _machine_tags(machine_id), k=k),
+        )
+        # Machine model changed under us: the hits belong to the wrong machine
+        if (row.get("machine_model") or "unknown") != machine_id:
+            machine_id = None
+    if machine_id is None:
+        row = await _fetch_inspection(inspection_id)
+        mem, skip = await _search_memory_async(query, _machine_tags(row.get("machine_model") or "unknown"), k=k)
+
+    return row, mem, _stages_skipped(memory=skip)
+
+
+def _stages_skipped(**reasons: Optional[str]) -> dict:
+    return {stage: reason for stage, reason in reasons.items() if reason}
+
+
+# -----------------------------
+# Inspection prompt
+# -----------------------------
+
+# The prompt is split in two. The static prefix (rules, allowed items, output
+# schema) is byte-identical on every call, so the provider's prompt cache can
+# serve it. Everything per-request (memory, checklist state, the user message)
+# comes after it. Bump INSPECTION_PROMPT_VERSION when the static text changes.
+INSPECTION_PROMPT_VERSION = "inspection-v2"
+
+_INSPECTION_RULES = """You are an AI inspection assistant for Caterpillar heavy equipment.
+
+STRICT RULES:
+- You may ONLY update checklist items from this exact list:
+{allowed_items}
+- Do NOT invent new checklist items.
+- Do NOT include any fields not specified.
+- Do NOT include risk inside checklist_updates.
+- risk_score must exist ONLY at the top level.
+
+Classify the user message as one of:
+- inspection_update
+- knowledge_question
+- unclear_input
+
+If inspection_update:
+- Update checklist items only from the allowed list above.
+- Assign PASS, MONITOR, or FAIL.
+- Provide short note.
+- Assign risk_score as Low, Moderate, or High.
+- For every checklist item you update, add a short explanation in update_reasoning explaining WHY that checklist item should be updated.
+
+If knowledge_question:
+- Do NOT modify checklist_updates.
+- risk_score must be null.
+- Provide clear guidance in answer.
+- update_reasoning must be an empty object.
+
+If unclear_input:
+- Do NOT modify checklist_updates.
+- risk_score must be null.
+- answer must be null.
+- Provide helpful follow_up_questions asking for clarification.
+- update_reasoning must be an empty object.
+
+Return ONLY valid JSON in this exact format:
+{{
+  "intent": "inspection_update | knowledge_question | unclear_input",
+  "checklist_updates": {{
+    "Item Name": {{
+      "status": "PASS | MONITOR | FAIL",
+      "note": "string"
+    }}
+  }},
+  "update_reasoning": {{
+    "Item Name": "string"
+  }},
+  "risk_score": "Low | Moderate | High | null",
+  "answer": "string | null",
+  "follow_up_questions": []
+}}
+
+The machine history, current checklist state and user message follow in the next message.
+"""
 
 
+@lru_cache(maxsize=16)
+def _inspection_static_prefix(allowed_items: tuple[str, ...]) -> str:
+    return _INSPECTION_RULES.format(allowed_items=json.dumps(list(allowed_items)))
 
-def run_inspection_logic(
+
+def build_inspection_prompt(
     user_text: str,
     current_checklist_state: Dict[str, Status],
-    images: Optional[List[str]] = None,
-    chat_history: Optional[List[Dict[str, str]]] = None,
+    allowed_items: list[str],
     memory_snippets: Optional[List[str]] = None,
     machine_id: Optional[str] = None,
-):
-    canonical_keys = get_flat_checklist_keys()
+) -> tuple[str, str]:
+    """Return (static prefix, per-request context) for an inspection call."""
+    memory_block = ""
+    if memory_snippets:
+        trimmed = [m.strip() for m in memory_snippets if m and m.strip()]
+        if trimmed:
+            joined = "\n".join([f"- {m}" for m in trimmed[:5]])
+            label = machine_id or "this machine"
+            memory_block = f"Recent machine history for {label}:\n{joined}\n\n"
+
+    context = (
+        f"{memory_block}"
+        f"Current checklist state:\n{json.dumps(current_checklist_state)}\n\n"
+        f"User message:\n{user_text}"
+    )
+    return _inspection_static_prefix(tuple(allowed_items)), context
+
+
+# Process-wide prompt usage, to watch the cached share of prefill go up
+prompt_usage_stats = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+
+def _record_usage(usage: Any, latency_ms: float) -> dict:
+    """Normalize chat.completions / responses usage objects and add them to the running totals."""
+    if usage is None:
+        return {"latency_ms": latency_ms}
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", None) or 0
+    completion_tokens = getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", None) or 0
+    details = getattr(usage, "prompt_tokens_details", None) or getattr(usage, "input_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+    prompt_usage_stats["calls"] += 1
+    prompt_usage_stats["prompt_tokens"] += prompt_tokens
+    prompt_usage_stats["cached_tokens"] += cached_tokens
+    prompt_usage_stats["completion_tokens"] += completion_tokens
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "completion_tokens": completion_tokens,
+        "latency_ms": latency_ms,
+    }
+
+
+@app.get("/debug/prompt-cache")
+def debug_prompt_cache():
+    prompt = prompt_usage_stats["prompt_tokens"]
+    return {
+        **prompt_usage_stats,
+        "prompt_version": INSPECTION_PROMPT_VERSION,
+        "cached_ratio": round(prompt_usage_stats["cached_tokens"] / prompt, 4) if prompt else None,
+    }
+
+
+# -----------------------------
+# Knowledge-question answer cache
+# -----------------------------
+
+# Repeated knowledge questions ("what's the right engine oil level") are
+# answered from memory, per machine model. The key is the question with
+# apostrophes dropped, common contractions expanded and then reduced like a
+# checklist item name (normalize_item: filler words removed, plurals
+# singularized), so "What's the DEF tank capacity?", "whats the def tanks
+# capacity" and "what is the DEF tank capacity" share one entry. Keys that
+# still differ must clear a strict cosine similarity over hashed character
+# trigrams, which only absorbs small typos: a different component ("air
+# filter" vs "cab air filter") never matches. Only
+# knowledge_question results are stored: inspection_update depends on
+# checklist state and is never cached. The cache is consulted only for
+# question-shaped input without chat history: a statement ("the hydraulic
+# tank is leaking") may be an update that trigram-matches a cached question,
+# and a follow-up ("what about the other one?") depends on the conversation.
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", str(24 * 3600)))
+ANSWER_CACHE_MIN_SIMILARITY = float(os.getenv("ANSWER_CACHE_MIN_SIMILARITY", "0.97"))
+NGRAM_DIM = 1024
+
+_WAKE_WORD = re.compile(r"^(hey|hi|ok|okay)\s+cat\b[\s,]*")
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_QUESTION_START = re.compile(
+    r"^(what|why|how|when|where|which|who|whose|should|can|could|does|do|did|is|are|was|were"
+    r"|will|would|shall|may|might|must|has|have)\b"
+)
+# Contractions as spelled once apostrophes are dropped ("what's" -> "whats")
+_CONTRACTIONS = {
+    "whats": "what is", "hows": "how is", "wheres": "where is", "whos": "who is", "whens": "when is",
+    "whys": "why is", "thats": "that is", "theres": "there is", "isnt": "is not", "arent": "are not",
+    "wasnt": "was not", "doesnt": "does not", "dont": "do not", "didnt": "did not", "cant": "can not",
+    "cannot": "can not", "wont": "will not", "shouldnt": "should not", "wouldnt": "would not",
+    "couldnt": "could not",
+}
+
+
+def _question_words(text: str) -> list[str]:
+    """Lowercase words without apostrophes, wake word or contractions."""
+    t = _NON_WORD.sub(" ", re.sub(r"['’]", "", (text or "").lower()))
+    t = _WAKE_WORD.sub("", " ".join(t.split()))
+    return " ".join(_CONTRACTIONS.get(w, w) for w in t.split()).split()
+
+
+def _normalize_question(text: str) -> str:
+    """Answer cache key: _question_words reduced like an item name (filler dropped, plurals singularized)."""
+    return normalize_item(" ".join(_question_words(text)))
+
+
+def _answer_cacheable(user_text: str, images: Optional[List[str]], chat_history: Optional[List[Dict[str, str]]]) -> bool:
+    """Only standalone, text-only questions go through the answer cache."""
+    if images or chat_history:
+        return False
+    text = (user_text or "").strip()
+    return text.endswith("?") or bool(_QUESTION_START.match(" ".join(_question_words(text))))
+
+
+def _ngram_vector(text: str, dim: int = NGRAM_DIM) -> np.ndarray:
+    """Unit-length hashed character-trigram vector (crc32 keeps it stable across processes)."""
+    vec = np.zeros(dim, dtype=np.float32)
+    padded = f" {text} "
+    for i in range(len(padded) - 2):
+        vec[zlib.crc32(padded[i:i + 3].encode()) % dim] += 1.0
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+class AnswerCache:
+    """LRU + TTL cache of knowledge_question results keyed by (machine model, normalized question)."""
+
+    def __init__(self, max_entries: int, ttl_s: float, min_similarity: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.min_similarity = min_similarity
+        self._entries: "OrderedDict[tuple[str, str], tuple[np.ndarray, dict, float]]" = OrderedDict()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def _expire(self, now: float) -> None:
+        for key in [k for k, (_, _, created) in self._entries.items() if now - created > self.ttl_s]:
+            del self._entries[key]
+            self.expired += 1
+
+    def lookup(self, question: str, machine_model: Optional[str]) -> Optional[dict]:
+        norm = _normalize_question(question)
+        if not norm:
+            return None
+        model = machine_model or "unknown"
+        self._expire(time.time())
+
+        key = (model, norm)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(self._entries[key][1])
+
+        candidates = [(k, v[0]) for k, v in self._entries.items() if k[0] == model]
+        if candidates:
+            sims = np.stack([vec for _, vec in candidates]) @ _ngram_vector(norm)
+            best = int(np.argmax(sims))
+            if float(sims[best]) >= self.min_similarity:
+                best_key = candidates[best][0]
+                self._entries.move_to_end(best_key)
+                self.hits += 1
+                self.similar_hits += 1
+                return copy.deepcopy(self._entries[best_key][1])
+
+        self.misses += 1
+        return None
+
+    def put(self, question: str, machine_model: Optional[str], result: dict) -> None:
+        if result.get("intent") != "knowledge_question" or result.get("checklist_updates"):
+            return
+        norm = _normalize_question(question)
+        if not norm:
+            return
+        key = (machine_model or "unknown", norm)
+        stored = {k: v for k, v in result.items() if k != "usage"}
+        self._entries[key] = (_ngram_vector(norm), copy.deepcopy(stored), time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "min_similarity": self.min_similarity,
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+answer_cache = AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_S, ANSWER_CACHE_MIN_SIMILARITY)
+
+
+@app.get("/debug/answer-cache")
+def debug_answer_cache():
+    return answer_cache.stats()
+
+
+# -----------------------------
+# Fast-path commands
+# -----------------------------
+
+# Plain verdicts ("tires pass", "seat belt fail, torn webbing") are parsed
+# locally by app/commands.py; anything it isn't confident about goes to the
+# model. Results carry `answered_by` (fast_path / answer_cache / model).
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "1") == "1"
+answer_path_stats = {"fast_path": 0, "answer_cache": 0, "model": 0}
+
+
+def _fast_path(user_text: str, canonical_keys: tuple[str, ...], images: Optional[List[str]]) -> Optional[dict]:
+    # With frames attached the model may see more than the words say
+    if not FAST_PATH_ENABLED or images:
+        return None
+    t0 = time.perf_counter()
+    result = parse_command(user_text, canonical_keys)
+    if result is None:
+        return None
+    result["answered_by"] = "fast_path"
+    result["fast_path_us"] = round((time.perf_counter() - t0) * 1e6, 1)
+    answer_path_stats["fast_path"] += 1
+    return result
+
+
+@app.get("/debug/answer-paths")
+def debug_answer_paths():
+    total = sum(answer_path_stats.values())
+    return {
+        **answer_path_stats,
+        "fast_path_enabled": FAST_PATH_ENABLED,
+        "fast_path_rate": round(answer_path_stats["fast_path"] / total, 4) if total else None,
+    }
 
+
+def _invalid_checklist_key(current_checklist_state: Dict[str, Status], template: ChecklistTemplate) -> Optional[dict]:
     # Validate incoming checklist keys against canonical checklist
     for key in current_checklist_state.keys():
-        if key not in canonical_keys:
+        if key not in template.key_set:
             return {
                 "error": f"Invalid checklist item: {key}"
             }
+    return None
 
-    allowed_items = canonical_keys
-    memory_block = ""
-    if memory_snippets:
-        trimmed = [m.strip() for m in memory_snippets if m and m.strip()]
-        if trimmed:
-            joined = "\n".join([f"- {m}" for m in trimmed[:5]])
-            label = machine_id or "this machine"
-            memory_block = f"\n\nRecent machine history for {label}:\n{joined}\n"
-
-    instruction_text = f"""
-    You are an AI inspection assistant for Caterpillar heavy equipment.
-
-    STRICT RULES:
-    - You may ONLY update checklist items from this exact list:
-    {allowed_items}
-    - Do NOT invent new checklist items.
-    - Do NOT include any fields not specified.
-    - Do NOT include risk inside checklist_updates.
-    - risk_score must exist ONLY at the top level.
-
-    Classify the user message as one of:
-    - inspection_update
-    - knowledge_question
-    - unclear_input
-
-    If inspection_update:
-    - Update checklist items only from the allowed list above.
-    - Assign PASS, MONITOR, or FAIL.
-    - Provide short note.
-    - Assign risk_score as Low, Moderate, or High.
-    - For every checklist item you update, add a short explanation in update_reasoning explaining WHY that checklist item should be updated.
-
-    If knowledge_question:
-    - Do NOT modify checklist_updates.
-    - risk_score must be null.
-    - Provide clear guidance in answer.
-    - update_reasoning must be an empty object.
-
-    If unclear_input:
-    - Do NOT modify checklist_updates.
-    - risk_score must be null.
-    - answer must be null.
-    - Provide helpful follow_up_questions asking for clarification.
-    - update_reasoning must be an empty object.
-
-    Return ONLY valid JSON in this exact format:
-    {{
-      "intent": "inspection_update | knowledge_question | unclear_input",
-      "checklist_updates": {{
-        "Item Name": {{
-          "status": "PASS | MONITOR | FAIL",
-          "note": "string"
-        }}
-      }},
-      "update_reasoning": {{
-        "Item Name": "string"
-      }},
-      "risk_score": "Low | Moderate | High | null",
-      "answer": "string | null",
-      "follow_up_questions": []
-    }}
 
-    User message:
-    {user_text}
+def _resolve_checklist_updates(result: dict, template: ChecklistTemplate) -> None:
+    """Map the model's item names onto canonical keys; names that don't resolve are dropped
+    and listed in `unresolved_items` rather than written to the checklist."""
+    updates = result.get("checklist_updates")
+    if not isinstance(updates, dict) or not updates:
+        return
+    reasoning = result.get("update_reasoning")
+    resolved: dict[str, Any] = {}
+    unresolved: list[str] = []
+    for name, update in updates.items():
+        key = template.resolve(name)
+        if key is None:
+            unresolved.append(name)
+            continue
+        resolved[key] = update
+        if key != name and isinstance(reasoning, dict) and name in reasoning:
+            reasoning[key] = reasoning.pop(name)
+    result["checklist_updates"] = resolved
+    if unresolved:
+        result["unresolved_items"] = unresolved
 
-    {memory_block}
 
-    Current checklist state:
-    {current_checklist_state}
-    """
+async def _prepare_inspection_call(
+    user_text: str,
+    current_checklist_state: Dict[str, Status],
+    allowed_items: list[str],
+    images: Optional[List[str]] = None,
+    chat_history: Optional[List[Dict[str, str]]] = None,
+    memory_snippets: Optional[List[str]] = None,
+    machine_id: Optional[str] = None,
+) -> tuple[str, dict, Optional[dict]]:
+    """Build the model request: ("responses" | "chat", create() kwargs, frame stats)."""
+    static_prefix, context = build_inspection_prompt(
+        user_text, current_checklist_state, allowed_items, memory_snippets, machine_id
+    )
 
     if images and len(images) > 0:
+        # Decode once, downscale, re-encode and drop near-duplicate frames
+        images, frame_stats = await asyncio.to_thread(preprocess_frames, images)
+
         content_blocks = [
-            {"type": "input_text", "text": instruction_text}
+            {"type": "input_text", "text": context}
         ]
 
         for img in images:
@@ -410,108 +1156,325 @@ def run_inspection_logic(
                 }
             )
 
-        response = client.responses.create(
-            model="gpt-4.1-mini",
-            input=[
+        return "responses", {
+            "model": "gpt-4.1-mini",
+            "input": [
+                {"role": "system", "content": static_prefix},
                 {
                     "role": "user",
                     "content": content_blocks
                 }
-            ]
-        )
-        return json.loads(response.output_text)
-    else:
-        # Build message list with memory
-        messages = [
-            {"role": "system", "content": instruction_text}
-        ]
+            ],
+            "prompt_cache_key": INSPECTION_PROMPT_VERSION,
+        }, frame_stats
+
+    # Static prefix first, then chat history, then this request's context
+    messages = [
+        {"role": "system", "content": static_prefix}
+    ]
+
+    if chat_history:
+        for msg in chat_history[-6:]:  # last 6 messages only
+            if msg.get("role") in ["user", "assistant"]:
+                messages.append({
+                    "role": msg["role"],
+                    "content": msg["content"]
+                })
+
+    messages.append({"role": "user", "content": context})
+
+    return "chat", {
+        "model": "gpt-4.1-mini",
+        "messages": messages,
+        "temperature": 0,
+        "prompt_cache_key": INSPECTION_PROMPT_VERSION,
+    }, None
+
+
+async def run_inspection_logic(
+    user_text: str,
+    current_checklist_state: Dict[str, Status],
+    images: Optional[List[str]] = None,
+    chat_history: Optional[List[Dict[str, str]]] = None,
+    memory_snippets: Optional[List[str]] = None,
+    machine_id: Optional[str] = None,
+):
+    template = checklist_registry.for_model(machine_id)
+    canonical_keys = template.keys
+
+    invalid = _invalid_checklist_key(current_checklist_state, template)
+    if invalid:
+        return invalid
+
+    fast = _fast_path(user_text, canonical_keys, images)
+    if fast is not None:
+        return fast
+
+    # Standalone text-only questions may be answered from the knowledge cache
+    cacheable = _answer_cacheable(user_text, images, chat_history)
+    if cacheable:
+        cached = answer_cache.lookup(user_text, machine_id)
+        if cached is not None:
+            cached["answer_cache"] = "hit"
+            cached["answered_by"] = "answer_cache"
+            answer_path_stats["answer_cache"] += 1
+            return cached
+
+    api, request_kwargs, frame_stats = await _prepare_inspection_call(
+        user_text, current_checklist_state, canonical_keys, images, chat_history, memory_snippets, machine_id
+    )
 
-        if chat_history:
-            for msg in chat_history[-6:]:  # last 6 messages only
-                if msg.get("role") in ["user", "assistant"]:
-                    messages.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
+    t0 = time.perf_counter()
+    async with _inspection_slots:
+        if api == "responses":
+            response = await aclient.responses.create(**request_kwargs)
+            content = response.output_text
+        else:
+            response = await aclient.chat.completions.create(**request_kwargs)
+            content = response.choices[0].message.content
+
+    result = json.loads(content)
+    _resolve_checklist_updates(result, template)
+    result["usage"] = _record_usage(getattr(response, "usage", None), _ms_since(t0))
+    if frame_stats is not None:
+        result["frame_stats"] = frame_stats
+    if cacheable:
+        answer_cache.put(user_text, machine_id, result)
+        result["answer_cache"] = "miss"
+    result["answered_by"] = "model"
+    answer_path_stats["model"] += 1
+    return result
 
-        messages.append({"role": "user", "content": user_text})
 
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=messages,
-            temperature=0
-        )
+# -----------------------------
+# Streaming (server-sent events)
+# -----------------------------
 
-        return json.loads(response.choices[0].message.content)
+_INTENT_RE = re.compile(r'"intent"\s*:\s*"(inspection_update|knowledge_question|unclear_input)"')
+_UPDATE_RE = re.compile(
+    r'"((?:[^"\\]|\\.)+)"\s*:\s*\{\s*"status"\s*:\s*"(PASS|MONITOR|FAIL)"\s*,\s*"note"\s*:\s*("(?:[^"\\]|\\.)*"|null)\s*\}'
+)
 
-@app.post("/analyze")
-def analyze(req: AnalyzeRequest):
-    #Fetch inspection from DB
-    resp = (
-        supabase.table("inspections")
-        .select("id, checklist_json, machine_model")
-        .eq("id", req.inspection_id)
-        .limit(1)
-        .execute()
-    )
 
-    rows = resp.data or []
-    if not rows:
-        raise HTTPException(status_code=404, detail="Inspection not found")
+def _partial_json_string(buffer: str, field: str) -> Optional[tuple[str, bool]]:
+    """Decode the (possibly still streaming) string value of `field` in a partial JSON buffer.
 
-    checklist_state = rows[0]["checklist_json"]
+    Returns (text so far, complete) or None if the field hasn't started / is null.
+    """
+    m = re.search(r'"' + re.escape(field) + r'"\s*:\s*"', buffer)
+    if not m:
+        return None
+    raw_start = m.end()
+    i = raw_start
+    while i < len(buffer):
+        ch = buffer[i]
+        if ch == "\\":
+            # Stop before an escape that hasn't fully arrived yet
+            need = 6 if buffer[i + 1:i + 2] == "u" else 2
+            if i + need > len(buffer):
+                break
+            i += need
+            continue
+        if ch == '"':
+            return json.loads('"' + buffer[raw_start:i] + '"'), True
+        i += 1
+    return json.loads('"' + buffer[raw_start:i] + '"'), False
 
-    # Supermemory retrieval (use machine_model as machine_id for MVP)
-    machine_id = rows[0].get("machine_model") or "unknown"
-    tags = _machine_tags(machine_id)
-    mem = sm_search_memory(req.user_text, tags, k=3)
 
-    memory_hits = mem
+class InspectionStreamParser:
+    """Turn streamed JSON deltas from the inspection prompt into events as fields complete.
 
-    result = run_inspection_logic(
-        user_text=req.user_text,
-        current_checklist_state=checklist_state,
-        images=req.images,
-        chat_history=req.chat_history,
-        memory_snippets=mem,
-        machine_id=machine_id,
+    Emits ("intent", ...) once, ("checklist_update", ...) per item and
+    ("answer_delta", ...) for new answer text. This relies on the field order
+    of the output schema (intent, checklist_updates, ..., answer).
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._intent_sent = False
+        self._updates_sent: set[str] = set()
+        self._answer_len = 0
+
+    def feed(self, delta: str) -> list[tuple[str, dict]]:
+        self.buffer += delta
+        events: list[tuple[str, dict]] = []
+
+        if not self._intent_sent:
+            m = _INTENT_RE.search(self.buffer)
+            if m:
+                self._intent_sent = True
+                events.append(("intent", {"intent": m.group(1)}))
+
+        start = self.buffer.find('"checklist_updates"')
+        if start >= 0:
+            for m in _UPDATE_RE.finditer(self.buffer, start):
+                item = json.loads('"' + m.group(1) + '"')
+                if item in self._updates_sent:
+                    continue
+                self._updates_sent.add(item)
+                events.append(("checklist_update", {
+                    "item": item,
+                    "status": m.group(2),
+                    "note": json.loads(m.group(3)),
+                }))
+
+        answer = _partial_json_string(self.buffer, "answer")
+        if answer is not None:
+            text, _ = answer
+            if len(text) > self._answer_len:
+                events.append(("answer_delta", {"text": text[self._answer_len:]}))
+                self._answer_len = len(text)
+
+        return events
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _as_analyze_response(result: dict) -> dict:
+    """Validate against AnalyzeResponse, keeping extra debug fields (usage, memory_hits, ...)."""
+    try:
+        return {**result, **AnalyzeResponse.model_validate(result).model_dump()}
+    except ValidationError:
+        return result
+
+
+async def stream_inspection_logic(
+    user_text: str,
+    current_checklist_state: Dict[str, Status],
+    images: Optional[List[str]] = None,
+    chat_history: Optional[List[Dict[str, str]]] = None,
+    memory_snippets: Optional[List[str]] = None,
+    machine_id: Optional[str] = None,
+):
+    """Streaming run_inspection_logic: yields (event, data) pairs, ending with ("done", result)."""
+    template = checklist_registry.for_model(machine_id)
+    canonical_keys = template.keys
+
+    invalid = _invalid_checklist_key(current_checklist_state, template)
+    if invalid:
+        yield "error", invalid
+        return
+
+    fast = _fast_path(user_text, canonical_keys, images)
+    if fast is not None:
+        yield "intent", {"intent": fast["intent"]}
+        for item, upd in fast["checklist_updates"].items():
+            yield "checklist_update", {"item": item, **upd}
+        yield "answer_delta", {"text": fast["answer"]}
+        yield "done", fast
+        return
+
+    cacheable = _answer_cacheable(user_text, images, chat_history)
+    if cacheable:
+        cached = answer_cache.lookup(user_text, machine_id)
+        if cached is not None:
+            cached["answer_cache"] = "hit"
+            cached["answered_by"] = "answer_cache"
+            answer_path_stats["answer_cache"] += 1
+            yield "intent", {"intent": cached.get("intent")}
+            if cached.get("answer"):
+                yield "answer_delta", {"text": cached["answer"]}
+            yield "done", cached
+            return
+
+    api, request_kwargs, frame_stats = await _prepare_inspection_call(
+        user_text, current_checklist_state, canonical_keys, images, chat_history, memory_snippets, machine_id
     )
 
-    # Debug: expose memory usage for the demo
-    result["memory_used"] = bool(memory_hits)
-    result["memory_hits"] = memory_hits
+    parser = InspectionStreamParser()
+    usage = None
+    t0 = time.perf_counter()
+    first_token_ms: Optional[float] = None
+    async with _inspection_slots:
+        if api == "responses":
+            stream = await aclient.responses.create(**request_kwargs, stream=True)
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    if first_token_ms is None:
+                        first_token_ms = _ms_since(t0)
+                    for ev in parser.feed(event.delta):
+                        if _resolve_stream_event(ev, template):
+                            yield ev
+                elif event.type == "response.completed":
+                    usage = event.response.usage
+        else:
+            stream = await aclient.chat.completions.create(
+                **request_kwargs, stream=True, stream_options={"include_usage": True}
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token_ms is None:
+                        first_token_ms = _ms_since(t0)
+                    for ev in parser.feed(chunk.choices[0].delta.content):
+                        if _resolve_stream_event(ev, template):
+                            yield ev
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+
+    result = json.loads(parser.buffer)
+    _resolve_checklist_updates(result, template)
+    result["usage"] = {**_record_usage(usage, _ms_since(t0)), "first_token_ms": first_token_ms}
+    if frame_stats is not None:
+        result["frame_stats"] = frame_stats
+    if cacheable:
+        answer_cache.put(user_text, machine_id, result)
+        result["answer_cache"] = "miss"
+    result["answered_by"] = "model"
+    answer_path_stats["model"] += 1
+    yield "done", result
+
+
+def _resolve_stream_event(event: tuple[str, dict], template: ChecklistTemplate) -> bool:
+    """Canonicalize the item of a checklist_update event in place; False if it doesn't resolve."""
+    name, data = event
+    if name != "checklist_update":
+        return True
+    key = template.resolve(data["item"])
+    if key is None:
+        return False
+    data["item"] = key
+    return True
+
+
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def _fallback_reason(item_name: str, status: str, note: str, user_text: str) -> str:
+    ut = (user_text or "").strip()
+    n = (note or "").strip()
+    s = (status or "").strip()
+
+    # Short, readable explanation for operators
+    reason_parts: list[str] = []
+    if ut:
+        reason_parts.append(f"You reported: \"{ut[:160]}\".")
+    if n:
+        reason_parts.append(f"Key detail: {n}")
+
+    # Safety / operational implication by status
+    if s == "FAIL":
+        reason_parts.append("Marked **FAIL** because this is a safety-critical issue that can cause damage or unsafe operation if not corrected.")
+        reason_parts.append("Recommended next step: stop operation for this item and repair/replace before continuing.")
+    elif s == "MONITOR":
+        reason_parts.append("Marked **MONITOR** because this may worsen over time. Continue operation cautiously and re-check soon.")
+        reason_parts.append("Recommended next step: document severity and schedule inspection/maintenance.")
+    elif s == "PASS":
+        reason_parts.append("Marked **PASS** because no defect was described and the condition appears acceptable based on the observation.")
+    else:
+        reason_parts.append("Updated based on the inspection detail provided.")
+
+    # Keep it concise (2–4 sentences)
+    text = " ".join(reason_parts).strip()
+    return text
+
 
+def _ensure_update_reasoning(result: dict, user_text: str) -> dict:
+    """Fill in update_reasoning for every updated item the model didn't explain."""
     # Ensure update_reasoning exists (so UI can show what/why)
     # The model usually returns this, but we also generate a richer fallback so
     # the UI can explain *why* an item changed.
-    def _fallback_reason(item_name: str, status: str, note: str, user_text: str) -> str:
-        ut = (user_text or "").strip()
-        n = (note or "").strip()
-        s = (status or "").strip()
-
-        # Short, readable explanation for operators
-        reason_parts: list[str] = []
-        if ut:
-            reason_parts.append(f"You reported: \"{ut[:160]}\".")
-        if n:
-            reason_parts.append(f"Key detail: {n}")
-
-        # Safety / operational implication by status
-        if s == "FAIL":
-            reason_parts.append("Marked **FAIL** because this is a safety-critical issue that can cause damage or unsafe operation if not corrected.")
-            reason_parts.append("Recommended next step: stop operation for this item and repair/replace before continuing.")
-        elif s == "MONITOR":
-            reason_parts.append("Marked **MONITOR** because this may worsen over time. Continue operation cautiously and re-check soon.")
-            reason_parts.append("Recommended next step: document severity and schedule inspection/maintenance.")
-        elif s == "PASS":
-            reason_parts.append("Marked **PASS** because no defect was described and the condition appears acceptable based on the observation.")
-        else:
-            reason_parts.append("Updated based on the inspection detail provided.")
-
-        # Keep it concise (2–4 sentences)
-        text = " ".join(reason_parts).strip()
-        return text
-
     updates = result.get("checklist_updates", {})
     reasoning = result.get("update_reasoning")
     if not isinstance(reasoning, dict):
@@ -530,34 +1493,371 @@ def analyze(req: AnalyzeRequest):
                 note = str(upd.get("note") or "").strip()
                 status = str(upd.get("status") or "").strip()
 
-            reasoning[item_name] = _fallback_reason(item_name, status, note, req.user_text)
+            reasoning[item_name] = _fallback_reason(item_name, status, note, user_text)
 
     result["update_reasoning"] = reasoning
-
-    # Apply updates to checklist JSON
-    for item_name, update_data in updates.items():
-        checklist_state[item_name] = update_data["status"]
-
-    #Save updated checklist back to DB
-    supabase.table("inspections").update(
-        {"checklist_json": checklist_state}
-    ).eq("id", req.inspection_id).execute()
-
     return result
 
-@app.get("/")
-def root():
-    return {"message": "CATrack backend running"}
 
+async def _analyze_inspection(
+    inspection_id: str,
+    user_text: str,
+    images: Optional[List[str]] = None,
+    chat_history: Optional[List[Dict[str, str]]] = None,
+    preloaded: Optional[tuple[dict, list[str], dict]] = None,
+) -> dict:
+    """Shared /analyze flow: load inspection, retrieve memory, run the model, persist updates.
 
-def public_storage_url(bucket: str, path: str) -> str:
-    """Generate public URL for Supabase storage (public buckets only)."""
-    return f"{SUPABASE_URL}/storage/v1/object/public/{bucket}/{path}"
+    `preloaded` is (row, memory hits, stages_skipped) when the caller already has them.
+    """
+    #Fetch inspection from DB alongside Supermemory retrieval (machine_model is the machine_id for MVP)
+    row, mem, stages_skipped = preloaded or await _load_inspection_and_memory(inspection_id, user_text, k=3)
 
+    checklist_state = row["checklist_json"]
+    machine_id = row.get("machine_model") or "unknown"
 
-@app.get("/health")
-def health():
-    return {"ok": True}
+    memory_hits = mem
+
+    result = await run_inspection_logic(
+        user_text=user_text,
+        current_checklist_state=checklist_state,
+        images=images,
+        chat_history=chat_history,
+        memory_snippets=mem,
+        machine_id=machine_id,
+    )
+
+    # Debug: expose memory usage for the demo
+    result["memory_used"] = bool(memory_hits)
+    result["memory_hits"] = memory_hits
+    result["stages_skipped"] = stages_skipped
+
+    _ensure_update_reasoning(result, user_text)
+    await _save_checklist_updates(inspection_id, row, result)
+
+    return result
+
+
+async def _save_checklist_updates(inspection_id: str, row: dict, result: dict) -> None:
+    """Write the model's checklist_updates as a versioned delta and note the outcome on `result`."""
+    updates = result.get("checklist_updates") or {}
+    delta = {item_name: update_data["status"] for item_name, update_data in updates.items()}
+    write = await apply_checklist_delta(inspection_id, delta, base=row)
+    result["checklist_version"] = write["version"]
+    result["checklist_write_attempts"] = write["attempts"]
+
+
+@app.post("/analyze")
+async def analyze(req: AnalyzeRequest):
+    return await _analyze_inspection(req.inspection_id, req.user_text, req.images, req.chat_history)
+
+
+@app.post("/analyze/stream")
+async def analyze_stream(req: AnalyzeRequest):
+    """SSE variant of /analyze.
+
+    Events arrive in this order: `intent`, one `checklist_update` per parsed
+    item, `answer_delta` chunks, then `result` with the full AnalyzeResponse.
+    The checklist is written once the stream completes.
+    """
+    row, mem, stages_skipped = await _load_inspection_and_memory(req.inspection_id, req.user_text, k=3)
+    checklist_state = row["checklist_json"]
+    machine_id = row.get("machine_model") or "unknown"
+
+    async def events():
+        result = None
+        try:
+            async for event, data in stream_inspection_logic(
+                user_text=req.user_text,
+                current_checklist_state=checklist_state,
+                images=req.images,
+                chat_history=req.chat_history,
+                memory_snippets=mem,
+                machine_id=machine_id,
+            ):
+                if event == "done":
+                    result = data
+                else:
+                    yield _sse(event, data)
+            if result is None:
+                return
+
+            result["memory_used"] = bool(mem)
+            result["memory_hits"] = mem
+            result["stages_skipped"] = stages_skipped
+            _ensure_update_reasoning(result, req.user_text)
+            await _save_checklist_updates(req.inspection_id, row, result)
+            yield _sse("result", _as_analyze_response(result))
+        except Exception as e:
+            yield _sse("error", {"error": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=_SSE_HEADERS)
+
+
+# -----------------------------
+# Assist-mode WebSocket session
+# -----------------------------
+
+# One socket per inspection. The checklist and machine memory are loaded once
+# and kept in memory; commands skip the per-request select/update round trips.
+# Changes are written behind: every ASSIST_FLUSH_INTERVAL_S while dirty, on an
+# explicit {"type": "flush"} and when the socket closes.
+ASSIST_FLUSH_INTERVAL_S = float(os.getenv("ASSIST_FLUSH_INTERVAL_S", "5"))
+ASSIST_MAX_BUFFERED_FRAMES = 4
+
+
+class AssistSession:
+    """In-memory state for one Assist-mode WebSocket."""
+
+    def __init__(self, inspection_id: str, row: dict, memory: list[str]):
+        self.inspection_id = inspection_id
+        self.checklist: dict = dict(row["checklist_json"] or {})
+        self.machine_id = row.get("machine_model") or "unknown"
+        self.memory = memory
+        self.chat_history: list[dict[str, str]] = []
+        self.frames: list[str] = []
+        self.pending: dict[str, str] = {}  # items changed since the last flush
+        self.flushes = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.pending)
+
+    def apply(self, updates: dict) -> None:
+        for item_name, update_data in updates.items():
+            self.checklist[item_name] = update_data["status"]
+            self.pending[item_name] = update_data["status"]
+
+    def remember(self, user_text: str, result: dict) -> None:
+        self.chat_history.append({"role": "user", "content": user_text})
+        reply = result.get("answer") or json.dumps(result.get("checklist_updates", {}))
+        self.chat_history.append({"role": "assistant", "content": reply})
+        self.chat_history = self.chat_history[-6:]
+
+    async def flush(self) -> bool:
+        async with self._lock:
+            if not self.pending:
+                return False
+            delta, self.pending = self.pending, {}
+            try:
+                await apply_checklist_delta(self.inspection_id, delta)
+            except Exception:
+                # Keep unsent items (newer edits made meanwhile win)
+                self.pending = {**delta, **self.pending}
+                raise
+            self.flushes += 1
+            return True
+
+    async def flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(ASSIST_FLUSH_INTERVAL_S)
+            try:
+                await self.flush()
+            except Exception as e:
+                print("Assist session flush failed:", e)
+
+
+@app.websocket("/ws/assist/{inspection_id}")
+async def assist_session(websocket: WebSocket, inspection_id: str):
+    """Assist-mode session.
+
+    Client messages:
+      {"type": "command", "text": "...", "frames": [b64, ...]}  (frames optional)
+      {"type": "frame", "image": b64}  buffer the latest glasses frame for the next command
+      {"type": "flush"}                write the checklist now
+      {"type": "ping"}
+    Server messages: ready, result, flushed, pong, error.
+    """
+    await websocket.accept()
+    try:
+        row = await _fetch_inspection(inspection_id)
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "error": e.detail})
+        await websocket.close(code=4404)
+        return
+
+    machine_id = row.get("machine_model") or "unknown"
+    memory, memory_skip = await _search_memory_async(f"{machine_id} inspection history", _machine_tags(machine_id), k=5)
+    session = AssistSession(inspection_id, row, memory)
+    flusher = asyncio.create_task(session.flush_periodically())
+
+    await websocket.send_json({
+        "type": "ready",
+        "checklist": session.checklist,
+        "memory_hits": len(memory),
+        "stages_skipped": _stages_skipped(memory=memory_skip),
+        "flush_interval_s": ASSIST_FLUSH_INTERVAL_S,
+    })
+
+    try:
+        while True:
+            # A malformed frame gets an error reply; the session stays open
+            raw = await websocket.receive_text()
+            try:
+                msg = json.loads(raw)
+            except ValueError:
+                await websocket.send_json({"type": "error", "error": "invalid JSON"})
+                continue
+            if not isinstance(msg, dict):
+                await websocket.send_json({"type": "error", "error": "message must be a JSON object"})
+                continue
+            kind = msg.get("type")
+
+            if kind == "ping":
+                await websocket.send_json({"type": "pong"})
+            elif kind == "frame":
+                if msg.get("image"):
+                    session.frames = (session.frames + [msg["image"]])[-ASSIST_MAX_BUFFERED_FRAMES:]
+            elif kind == "flush":
+                try:
+                    wrote = await session.flush()
+                except Exception as e:
+                    # Unsent items stay pending for the next flush; the session stays open
+                    detail = e.detail if isinstance(e, HTTPException) else str(e)
+                    await websocket.send_json({"type": "error", "error": f"flush failed: {detail}", "pending_write": session.dirty})
+                    continue
+                await websocket.send_json({"type": "flushed", "written": wrote})
+            elif kind == "command":
+                text = (msg.get("text") or "").strip()
+                if not text:
+                    await websocket.send_json({"type": "error", "error": "empty command"})
+                    continue
+                frames = msg.get("frames") or session.frames or None
+                session.frames = []
+                try:
+                    result = await run_inspection_logic(
+                        user_text=text,
+                        current_checklist_state=session.checklist,
+                        images=frames,
+                        chat_history=session.chat_history,
+                        memory_snippets=session.memory,
+                        machine_id=session.machine_id,
+                    )
+                except Exception as e:
+                    await websocket.send_json({"type": "error", "error": f"analysis failed: {e}"})
+                    continue
+                if "error" in result:
+                    await websocket.send_json({"type": "error", **result})
+                    continue
+
+                _ensure_update_reasoning(result, text)
+                session.apply(result.get("checklist_updates", {}))
+                session.remember(text, result)
+                await websocket.send_json({"type": "result", **result, "pending_write": session.dirty})
+            else:
+                await websocket.send_json({"type": "error", "error": f"unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        flusher.cancel()
+        try:
+            await session.flush()
+        except Exception as e:
+            print("Assist session final flush failed:", e)
+
+
+VIDEO_MAX_BYTES = int(os.getenv("VIDEO_MAX_BYTES", str(200 * 1024 * 1024)))
+VIDEO_TOP_K_MAX = 8
+
+
+async def _spool_video_upload(upload: UploadFile, dest) -> int:
+    """Copy an uploaded video to `dest` in chunks, enforcing VIDEO_MAX_BYTES."""
+    size = 0
+    while True:
+        chunk = await upload.read(1024 * 1024)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > VIDEO_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Video too large")
+        dest.write(chunk)
+    return size
+
+
+async def _spool_video_media(media_id: str, dest) -> int:
+    """Stream a stored video from Supabase storage to `dest`, enforcing VIDEO_MAX_BYTES."""
+    media_rows = await _fetch_media_rows([media_id])
+    if media_id not in media_rows:
+        raise HTTPException(status_code=404, detail="media_id not found")
+    row = media_rows[media_id]
+
+    size = 0
+    async with http_client.stream("GET", public_storage_url(row["bucket"], row["path"])) as r:
+        if r.status_code != 200:
+            raise HTTPException(status_code=500, detail=f"download failed: {r.status_code}")
+        async for chunk in r.aiter_bytes():
+            size += len(chunk)
+            if size > VIDEO_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Video too large")
+            dest.write(chunk)
+    return size
+
+
+@app.post("/analyze-video")
+async def analyze_video(
+    inspection_id: str = Form(...),
+    user_text: str = Form(...),
+    top_k: int = Form(4),
+    media_id: Optional[str] = Form(None),
+    video_file: Optional[UploadFile] = File(None),
+):
+    """Analyze a video (upload or stored media_id) by sending only its best keyframes to the model.
+
+    Frames are sampled at a fixed stride and scored for sharpness and novelty;
+    only the top_k go into run_inspection_logic.
+    """
+    if (video_file is None) == (media_id is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of video_file or media_id")
+    top_k = max(1, min(top_k, VIDEO_TOP_K_MAX))
+
+    # A bad inspection_id 404s before any download or decode; memory retrieval
+    # then runs while the video is spooled and decoded
+    row = await _fetch_inspection(inspection_id)
+    memory = asyncio.create_task(
+        _search_memory_async(user_text, _machine_tags(row.get("machine_model") or "unknown"), k=3)
+    )
+    try:
+        # ffmpeg needs a seekable file for MP4 (moov atom may sit at the end)
+        with tempfile.NamedTemporaryFile(suffix=".mp4", delete=True) as video:
+            if video_file is not None:
+                size = await _spool_video_upload(video_file, video)
+            else:
+                size = await _spool_video_media(media_id, video)
+            video.flush()
+            if size == 0:
+                raise HTTPException(status_code=400, detail="Empty video")
+
+            try:
+                frames, keyframe_stats = await asyncio.to_thread(select_keyframes, video.name, top_k)
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"video decode failed: {e}")
+
+        if not frames:
+            raise HTTPException(status_code=400, detail="No decodable frames in video")
+        mem, memory_skip = await memory
+    finally:
+        memory.cancel()
+
+    result = await _analyze_inspection(
+        inspection_id, user_text, images=frames, preloaded=(row, mem, _stages_skipped(memory=memory_skip))
+    )
+    result["keyframes"] = {**keyframe_stats, "bytes_uploaded": size}
+    return result
+
+@app.get("/")
+def root():
+    return {"message": "CATrack backend running"}
+
+
+def public_storage_url(bucket: str, path: str) -> str:
+    """Generate public URL for Supabase storage (public buckets only)."""
+    return f"{SUPABASE_URL}/storage/v1/object/public/{bucket}/{path}"
+
+
+@app.get("/health")
+def health():
+    return {"ok": True}
 
 
 # Supermemory debug status endpoint
@@ -567,14 +1867,24 @@ def debug_memory_status():
         "configured": bool(sm_client),
         "has_api_key": bool(SUPERMEMORY_API_KEY),
         "client_type": str(type(sm_client)) if sm_client else None,
+        "backend": MEMORY_BACKEND,
+        "budget_ms": MEMORY_BUDGET_MS,
+        "breaker": memory_breaker.stats(),
+        "local_index": local_memory.stats(),
     }
+
+
+@app.post("/debug/memory-compact")
+def debug_memory_compact():
+    """Compact the local memory index (drop replaced entries, enforce MEMORY_INDEX_MAX_ITEMS)."""
+    return local_memory.compact()
 # Supermemory debug endpoint
 @app.get("/debug/memory")
 def debug_memory(machine_id: str, q: str, k: int = 5):
-    """Debug endpoint to verify Supermemory storage/retrieval for a machine."""
+    """Debug endpoint to verify memory storage/retrieval for a machine."""
     tags = _machine_tags(machine_id)
-    hits = sm_search_memory(q, tags, k=k)
-    return {"machine_id": machine_id, "q": q, "k": k, "hits": hits}
+    hits = memory_search(q, tags, k=k)
+    return {"machine_id": machine_id, "q": q, "k": k, "backend": MEMORY_BACKEND, "hits": hits}
 
 
 # Raw Supermemory search object info for debugging
@@ -620,9 +1930,9 @@ def debug_memory_raw(machine_id: str, q: str, k: int = 5):
 def debug_memory_add(machine_id: str, content: str, q: str = "", k: int = 5):
     """Force add a memory under machine tag and optionally search immediately."""
     tags = _machine_tags(machine_id)
-    sm_add_memory(content, tags)
+    memory_add(content, tags)
     query = q or content
-    hits = sm_search_memory(query, tags, k=k)
+    hits = memory_search(query, tags, k=k)
     return {"machine_id": machine_id, "tags": tags, "query": query, "hits": hits}
 
 
@@ -655,26 +1965,19 @@ def debug_next_media():
     return rows[0]
 
 @app.post("/sync-checklist")
-def sync_checklist(req: SyncChecklistRequest):
-    # Ensure the inspection exists before updating
-    inspection_result = (
-        supabase.table("inspections")
-        .select("id")
-        .eq("id", req.inspection_id)
-        .limit(1)
-        .execute()
-    )
+async def sync_checklist(req: SyncChecklistRequest):
+    # The client's checklist replaces the stored one: send only the items that
+    # differ, plus the names of items it no longer has
+    row = await _fetch_inspection(req.inspection_id, _checklist_columns())
 
-    if not inspection_result.data:
-        raise HTTPException(status_code=404, detail="Inspection not found")
+    write = await apply_checklist_delta(req.inspection_id, req.checklist, base=row, replace=True)
 
-    updated_data = {"checklist_json": req.checklist}
-
-    supabase.table("inspections").update(updated_data).eq(
-        "id", req.inspection_id
-    ).execute()
-
-    return {"status": "ok"}
+    return {
+        "status": "ok",
+        "changed": len(write["changed"]),
+        "removed": len(write["removed"]),
+        "version": write["version"],
+    }
 
 @app.get("/debug/download/{media_id}")
 def debug_download(media_id: str):
@@ -711,76 +2014,257 @@ def debug_download(media_id: str):
     }
 
 
-@app.post("/process-next-audio")
-def process_next_audio():
-    # 1) Pick the next uploaded audio (voice note only)
-    resp = (
-        supabase.table("media")
-        .select("id,bucket,path,status,type,created_at")
-        .eq("type", "audio")
-        .eq("status", "uploaded")
-        .eq("category", "inspection_voice")
-        .order("created_at", desc=False)
-        .limit(1)
-        .execute()
-    )
-    rows = resp.data or []
-    if not rows:
-        return {"message": "no uploaded audio to process"}
+# -----------------------------
+# Voice-note transcription worker
+# -----------------------------
 
-    row = rows[0]
-    media_id = row["id"]
+# Rows are claimed in batches with a conditional update (status must still be
+# `uploaded`), so two workers can never claim the same row. Rows left in
+# `processing` longer than TRANSCRIBE_STALE_AFTER_S (worker crashed mid-batch)
+# go back to `uploaded`. Requires a `claimed_at` timestamptz column on media;
+# the worker checks for it at startup and stays off (with a log line) without it:
+#   ALTER TABLE media ADD COLUMN IF NOT EXISTS claimed_at timestamptz;
+TRANSCRIBE_WORKER_ENABLED = os.getenv("TRANSCRIBE_WORKER_ENABLED", "1") == "1"
+TRANSCRIBE_BATCH_SIZE = int(os.getenv("TRANSCRIBE_BATCH_SIZE", "8"))
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", "4"))
+TRANSCRIBE_MAX_ATTEMPTS = int(os.getenv("TRANSCRIBE_MAX_ATTEMPTS", "3"))
+TRANSCRIBE_RETRY_BASE_S = float(os.getenv("TRANSCRIBE_RETRY_BASE_S", "1.0"))
+TRANSCRIBE_STALE_AFTER_S = float(os.getenv("TRANSCRIBE_STALE_AFTER_S", "600"))
+TRANSCRIBE_POLL_INTERVAL_S = float(os.getenv("TRANSCRIBE_POLL_INTERVAL_S", "5"))
+
+
+def _utc_iso(ts: Optional[float] = None) -> str:
+    dt = datetime.fromtimestamp(ts, timezone.utc) if ts is not None else datetime.now(timezone.utc)
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Network trouble, rate limits and 5xx are worth retrying; bad input is not."""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, (httpx.HTTPError, openai.APIConnectionError, openai.APITimeoutError))
+
+
+class TranscriptionWorker:
+    """Background worker that claims `uploaded` voice notes in batches and transcribes them."""
+
+    def __init__(self, batch_size: int, concurrency: int, max_attempts: int, poll_interval_s: float):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval_s = poll_interval_s
+        self._sem = asyncio.Semaphore(concurrency)
+        self._batch_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._recent: list[tuple[float, int]] = []  # (finished_at, rows transcribed)
+        self.transcribed = 0
+        self.failed = 0
+        self.reclaimed = 0
+        self.retries = 0
+        self.batches = 0
+        self.last_error: Optional[str] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                summary = await self.run_once()
+                if summary["claimed"]:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                print("Transcription worker batch failed:", e)
+            await asyncio.sleep(self.poll_interval_s)
+
+    async def schema_ready(self) -> bool:
+        """Whether media has the `claimed_at` column the claim/reclaim queries rely on."""
+        try:
+            await asupabase.table("media").select("id, claimed_at").limit(1).execute()
+            return True
+        except Exception as e:
+            self.last_error = f"media.claimed_at unavailable: {e}"
+            print("Transcription worker not started (run the media.claimed_at migration):", e)
+            return False
+
+    async def reclaim_stale(self) -> int:
+        # Only rows whose lease has expired; claim_batch always sets claimed_at
+        cutoff = _utc_iso(time.time() - TRANSCRIBE_STALE_AFTER_S)
+        resp = await (
+            asupabase.table("media")
+            .update({"status": "uploaded", "claimed_at": None})
+            .eq("type", "audio")
+            .eq("category", "inspection_voice")
+            .eq("status", "processing")
+            .lt("claimed_at", cutoff)
+            .execute()
+        )
+        n = len(resp.data or [])
+        self.reclaimed += n
+        return n
+
+    async def claim_batch(self) -> list[dict]:
+        candidates = await (
+            asupabase.table("media")
+            .select("id")
+            .eq("type", "audio")
+            .eq("status", "uploaded")
+            .eq("category", "inspection_voice")
+            .order("created_at", desc=False)
+            .limit(self.batch_size)
+            .execute()
+        )
+        ids = [r["id"] for r in candidates.data or []]
+        if not ids:
+            return []
 
-    # 2) Lock it (avoid double-processing)
-    supabase.table("media").update({"status": "processing"}).eq("id", media_id).execute()
+        # Only rows that are still `uploaded` flip to `processing`; rows another
+        # worker claimed in between are simply not returned.
+        claimed = await (
+            asupabase.table("media")
+            .update({"status": "processing", "claimed_at": _utc_iso()})
+            .in_("id", ids)
+            .eq("status", "uploaded")
+            .execute()
+        )
+        return claimed.data or []
 
-    try:
-        # 3) Download audio bytes from Supabase Storage (public URL)
+    async def _transcribe(self, row: dict) -> str:
         url = public_storage_url(row["bucket"], row["path"])
-        r = requests.get(url, timeout=30)
-        if r.status_code != 200 or not r.content:
-            raise RuntimeError(f"download failed: {r.status_code} {r.text[:200]}")
-
-        audio_bytes = r.content
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with self._sem:
+                    # Network errors, timeouts, 429 and 5xx are retried (see _is_retryable)
+                    r = await http_client.get(url, timeout=30)
+                    if r.status_code != 200:
+                        raise httpx.HTTPStatusError(
+                            f"download failed: {r.status_code} {r.text[:200]}", request=r.request, response=r
+                        )
+                    if not r.content:
+                        raise RuntimeError("download failed: empty body")
+
+                    # Give the in-memory bytes a filename so the API can infer format.
+                    f = io.BytesIO(r.content)
+                    f.name = "audio.m4a"
+                    tr = await aclient.audio.transcriptions.create(model=TRANSCRIBE_MODEL, file=f)
+                transcript_text = (tr.text or "").strip()
+                if len(transcript_text) < 3:
+                    raise RuntimeError("transcript too short/empty (please re-record)")
+                return transcript_text
+            except Exception as e:
+                if attempt >= self.max_attempts or not _is_retryable(e):
+                    raise
+                self.retries += 1
+                await asyncio.sleep(TRANSCRIBE_RETRY_BASE_S * (2 ** (attempt - 1)))
+
+    async def run_once(self) -> dict:
+        """Reclaim stale rows, claim one batch and transcribe it."""
+        async with self._batch_lock:
+            await self.reclaim_stale()
+            rows = await self.claim_batch()
+            if not rows:
+                return {"claimed": 0, "transcribed": [], "failed": []}
+
+            results = await asyncio.gather(*(self._transcribe(row) for row in rows), return_exceptions=True)
+
+            done: list[dict] = []
+            failed: list[dict] = []
+            for row, result in zip(rows, results):
+                if isinstance(result, BaseException):
+                    failed.append({"media_id": row["id"], "error": str(result)})
+                else:
+                    done.append({"media_id": row["id"], "text": result})
+
+            if done:
+                await asupabase.table("transcripts").insert(
+                    [{"media_id": d["media_id"], "text": d["text"]} for d in done]
+                ).execute()
+                await asupabase.table("media").update(
+                    {"status": "transcribed", "error_message": None}
+                ).in_("id", [d["media_id"] for d in done]).execute()
+            for fl in failed:
+                await asupabase.table("media").update(
+                    {"status": "failed", "error_message": fl["error"]}
+                ).eq("id", fl["media_id"]).execute()
+
+            now = time.time()
+            self.batches += 1
+            self.transcribed += len(done)
+            self.failed += len(failed)
+            self._recent.append((now, len(done)))
+            self._recent = [(t, n) for t, n in self._recent if now - t <= 300]
 
-        # 4) Whisper / Speech-to-text
-        # Give the in-memory bytes a filename so the API can infer format.
-        f = io.BytesIO(audio_bytes)
-        # Keep extension aligned with what you uploaded (m4a is fine for iOS recordings)
-        f.name = "audio.m4a"
+            return {
+                "claimed": len(rows),
+                "transcribed": [
+                    {"media_id": d["media_id"], "transcript_preview": d["text"][:200]} for d in done
+                ],
+                "failed": failed,
+            }
 
-        tr = client.audio.transcriptions.create(
-            model=TRANSCRIBE_MODEL,  # e.g. gpt-4o-mini-transcribe or whisper-1
-            file=f,
+    async def _count(self, status: str) -> int:
+        resp = await (
+            asupabase.table("media")
+            .select("id", count="exact")
+            .eq("type", "audio")
+            .eq("category", "inspection_voice")
+            .eq("status", status)
+            .limit(1)
+            .execute()
         )
-        transcript_text = (tr.text or "").strip()
+        return resp.count or 0
 
-        if len(transcript_text) < 3:
-            raise RuntimeError("transcript too short/empty (please re-record)")
+    async def status(self) -> dict:
+        uploaded, processing = await asyncio.gather(self._count("uploaded"), self._count("processing"))
+        now = time.time()
+        recent = sum(n for t, n in self._recent if now - t <= 300)
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "queue_depth": uploaded,
+            "processing": processing,
+            "transcribed_total": self.transcribed,
+            "failed_total": self.failed,
+            "reclaimed_total": self.reclaimed,
+            "retries_total": self.retries,
+            "batches": self.batches,
+            "throughput_per_min_5m": round(recent / 5.0, 2),
+            "last_error": self.last_error,
+        }
 
-        # 5) Store transcript
-        supabase.table("transcripts").insert(
-            {"media_id": media_id, "text": transcript_text}
-        ).execute()
 
-        # 6) Mark complete
-        supabase.table("media").update(
-            {"status": "transcribed", "error_message": None}
-        ).eq("id", media_id).execute()
+transcription_worker = TranscriptionWorker(
+    TRANSCRIBE_BATCH_SIZE, TRANSCRIBE_CONCURRENCY, TRANSCRIBE_MAX_ATTEMPTS, TRANSCRIBE_POLL_INTERVAL_S
+)
 
-        return {
-            "media_id": media_id,
-            "status": "transcribed",
-            "transcript_preview": transcript_text[:200],
-            "bytes_downloaded": len(audio_bytes),
-        }
 
-    except Exception as e:
+@app.post("/process-next-audio")
+async def process_next_audio():
+    """Process one batch of uploaded voice notes now (the background worker does this continuously)."""
+    summary = await transcription_worker.run_once()
+    if not summary["claimed"]:
+        return {"message": "no uploaded audio to process"}
+    return summary
 
-        supabase.table("media").update(
-            {"status": "failed", "error_message": str(e)}
-        ).eq("id", media_id).execute()
-        raise HTTPException(status_code=500, detail=f"processing failed: {e}")
+
+@app.get("/worker/transcription/status")
+async def transcription_worker_status():
+    return await transcription_worker.status()
 
 
 
@@ -791,44 +2275,36 @@ async def voice_analyze(
     audio_file: UploadFile = File(...)
 ):
     try:
-        # Fetch inspection from DB (checklist stored server-side)
-        resp = (
-            supabase.table("inspections")
-            .select("id, checklist_json, machine_model")
-            .eq("id", inspection_id)
-            .limit(1)
-            .execute()
-        )
-
-        rows = resp.data or []
-        if not rows:
-            raise HTTPException(status_code=404, detail="Inspection not found")
-
-        checklist_state = rows[0]["checklist_json"]
-
         #Read audio bytes
         audio_bytes = await audio_file.read()
         f = io.BytesIO(audio_bytes)
         f.name = audio_file.filename or "audio.m4a"
 
         #Transcribe using OpenAI speech model
-        tr = client.audio.transcriptions.create(
-            model=TRANSCRIBE_MODEL,
-            file=f,
-        )
+        async def transcribe():
+            async with _inspection_slots:
+                return await aclient.audio.transcriptions.create(
+                    model=TRANSCRIBE_MODEL,
+                    file=f,
+                )
+
+        # Fetch inspection from DB (checklist stored server-side) while transcribing
+        row, tr = await asyncio.gather(_fetch_inspection(inspection_id), transcribe())
+
+        checklist_state = row["checklist_json"]
 
         transcript_text = (tr.text or "").strip()
 
         if len(transcript_text) < 3:
             raise RuntimeError("transcript too short/empty")
 
-        machine_id = rows[0].get("machine_model") or "unknown"
+        machine_id = row.get("machine_model") or "unknown"
         tags = _machine_tags(machine_id)
-        mem = sm_search_memory(transcript_text, tags, k=3)
+        mem, memory_skip = await _search_memory_async(transcript_text, tags, k=3)
 
         memory_hits = mem
 
-        result = run_inspection_logic(
+        result = await run_inspection_logic(
             user_text=transcript_text,
             current_checklist_state=checklist_state,
             images=None,
@@ -839,88 +2315,262 @@ async def voice_analyze(
         # Debug: expose memory usage for the demo
         result["memory_used"] = bool(memory_hits)
         result["memory_hits"] = memory_hits
+        result["stages_skipped"] = _stages_skipped(memory=memory_skip)
 
-        # Ensure update_reasoning exists (so UI can show what/why)
-        # The model usually returns this, but we also generate a richer fallback so
-        # the UI can explain *why* an item changed.
-        def _fallback_reason(item_name: str, status: str, note: str, user_text: str) -> str:
-            ut = (user_text or "").strip()
-            n = (note or "").strip()
-            s = (status or "").strip()
-
-            reason_parts: list[str] = []
-            if ut:
-                reason_parts.append(f"Transcript said: \"{ut[:160]}\".")
-            if n:
-                reason_parts.append(f"Key detail: {n}")
-
-            if s == "FAIL":
-                reason_parts.append("Marked **FAIL** because this is safety-critical and needs repair before operation.")
-                reason_parts.append("Recommended next step: stop operation for this item and repair/replace before continuing.")
-            elif s == "MONITOR":
-                reason_parts.append("Marked **MONITOR** because this may worsen; re-check soon and schedule maintenance.")
-            elif s == "PASS":
-                reason_parts.append("Marked **PASS** because no defect was described and the condition appears acceptable.")
-            else:
-                reason_parts.append("Updated based on the inspection detail provided.")
+        _ensure_update_reasoning(result, transcript_text)
 
-            return " ".join(reason_parts).strip()
+        #Save updated checklist items back to DB
+        await _save_checklist_updates(inspection_id, row, result)
 
-        updates = result.get("checklist_updates", {})
-        reasoning = result.get("update_reasoning")
-        if not isinstance(reasoning, dict):
-            reasoning = {}
+        return result
 
-        if isinstance(updates, dict):
-            for item_name, upd in updates.items():
-                existing = reasoning.get(item_name)
-                if isinstance(existing, str) and existing.strip():
-                    continue
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"voice processing failed: {e}")
 
-                note = ""
-                status = ""
-                if isinstance(upd, dict):
-                    note = str(upd.get("note") or "").strip()
-                    status = str(upd.get("status") or "").strip()
 
-                reasoning[item_name] = _fallback_reason(item_name, status, note, transcript_text)
+# -----------------------------
+# Write outbox
+# -----------------------------
 
-        result["update_reasoning"] = reasoning
+# Report upserts and memory adds are queued in a local SQLite outbox and
+# delivered by a background task, so /generate-report returns as soon as the
+# report JSON is ready. Rows survive restarts; failed deliveries back off
+# exponentially (OUTBOX_RETRY_BASE_S, capped at OUTBOX_RETRY_MAX_S) and are
+# parked as `dead` after OUTBOX_MAX_ATTEMPTS. A newer row with the same
+# dedupe key supersedes older undelivered ones.
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.sqlite3")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE_S = float(os.getenv("OUTBOX_RETRY_BASE_S", "2"))
+OUTBOX_RETRY_MAX_S = float(os.getenv("OUTBOX_RETRY_MAX_S", "300"))
+OUTBOX_POLL_INTERVAL_S = float(os.getenv("OUTBOX_POLL_INTERVAL_S", "2"))
+
+
+class WriteOutbox:
+    """Durable queue of side-effect writes (`report_upsert`, `memory_add`) with a delivery task."""
+
+    def __init__(self, path: str, batch_size: int, max_attempts: int, poll_interval_s: float):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval_s = poll_interval_s
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                dedupe_key TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                created_at REAL NOT NULL,
+                last_error TEXT
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_dedupe ON outbox (kind, dedupe_key)")
+        # Rows left in flight by a previous process are simply retried
+        self._conn.execute("UPDATE outbox SET status = 'pending' WHERE status = 'inflight'")
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.delivered = 0
+        self.failures = 0
+        self.superseded = 0
+        self.dead = 0
+        self.last_error: Optional[str] = None
+
+    def enqueue(self, kind: str, payload: dict, dedupe_key: Optional[str] = None) -> int:
+        """Queue one write (callable from any thread) and wake the delivery task."""
+        now = time.time()
+        with self._lock:
+            if dedupe_key is not None:
+                cur = self._conn.execute(
+                    "DELETE FROM outbox WHERE kind = ? AND dedupe_key = ? AND status = 'pending'",
+                    (kind, dedupe_key),
+                )
+                self.superseded += cur.rowcount
+            cur = self._conn.execute(
+                "INSERT INTO outbox (kind, dedupe_key, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, dedupe_key, json.dumps(payload), now, now),
+            )
+            row_id = cur.lastrowid
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+        return row_id
+
+    def start(self) -> None:
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._loop = None
 
-        #apply updates to checklist JSON
-        for item_name, update_data in updates.items():
-            checklist_state[item_name] = update_data["status"]
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await self.run_once():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                print("Outbox delivery failed:", e)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def _claim(self) -> list[tuple[int, str, Optional[str], dict, int]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, kind, dedupe_key, payload, attempts FROM outbox "
+                "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (time.time(), self.batch_size),
+            ).fetchall()
+            if rows:
+                self._conn.executemany("UPDATE outbox SET status = 'inflight' WHERE id = ?", [(r[0],) for r in rows])
+        return [(row_id, kind, key, json.loads(payload), attempts) for row_id, kind, key, payload, attempts in rows]
+
+    def _succeed(self, ids: list[int]) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+        self.delivered += len(ids)
+
+    def _fail(self, rows: list[tuple], error: Exception) -> None:
+        self.failures += len(rows)
+        self.last_error = f"{type(error).__name__}: {error}"
+        now = time.time()
+        with self._lock:
+            for row_id, kind, key, _, attempts in rows:
+                attempts += 1
+                if key is not None and self._conn.execute(
+                    "SELECT 1 FROM outbox WHERE kind = ? AND dedupe_key = ? AND id > ? LIMIT 1", (kind, key, row_id)
+                ).fetchone():
+                    # A newer write for the same key is queued; retrying this one would clobber it
+                    self._conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                    self.superseded += 1
+                elif attempts >= self.max_attempts:
+                    self._conn.execute(
+                        "UPDATE outbox SET status = 'dead', attempts = ?, last_error = ? WHERE id = ?",
+                        (attempts, self.last_error, row_id),
+                    )
+                    self.dead += 1
+                else:
+                    delay = min(OUTBOX_RETRY_MAX_S, OUTBOX_RETRY_BASE_S * 2 ** (attempts - 1))
+                    self._conn.execute(
+                        "UPDATE outbox SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                        (attempts, now + delay * random.uniform(0.8, 1.2), self.last_error, row_id),
+                    )
+
+    async def run_once(self) -> int:
+        """Deliver one batch of due rows. Returns how many rows were attempted."""
+        rows = self._claim()
+        if not rows:
+            return 0
 
-        #Save updated checklist back to DB
-        supabase.table("inspections").update(
-            {"checklist_json": checklist_state}
-        ).eq("id", inspection_id).execute()
+        upserts = [r for r in rows if r[1] == "report_upsert"]
+        if upserts:
+            # One round trip for the batch; the latest row per inspection wins
+            latest = {r[3]["inspection_id"]: r[3] for r in upserts}
+            try:
+                await (
+                    asupabase.table("inspection_reports")
+                    .upsert(list(latest.values()), on_conflict="inspection_id")
+                    .execute()
+                )
+                self._succeed([r[0] for r in upserts])
+            except Exception as e:
+                print("Outbox report upsert failed:", e)
+                self._fail(upserts, e)
+
+        for row in rows:
+            if row[1] == "memory_add":
+                p = row[3]
+                try:
+                    await asyncio.to_thread(memory_add, p["content"], p["tags"], p.get("key"), True)
+                    self._succeed([row[0]])
+                except Exception as e:
+                    self._fail([row], e)
+            elif row[1] != "report_upsert":
+                self._fail([row], ValueError(f"unknown outbox kind {row[1]!r}"))
+        return len(rows)
+
+    def pending_payload(self, kind: str, dedupe_key: str) -> Optional[dict]:
+        """Latest undelivered payload for a key, so readers see writes still in the queue."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM outbox WHERE kind = ? AND dedupe_key = ? AND status != 'dead' "
+                "ORDER BY id DESC LIMIT 1",
+                (kind, dedupe_key),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def status(self) -> dict:
+        now = time.time()
+        with self._lock:
+            counts = self._conn.execute(
+                "SELECT kind, status, COUNT(*), MIN(created_at) FROM outbox GROUP BY kind, status"
+            ).fetchall()
+        depth: dict[str, dict[str, int]] = {}
+        oldest: Optional[float] = None
+        for kind, status, n, created in counts:
+            depth.setdefault(kind, {})[status] = n
+            if status != "dead" and created is not None:
+                oldest = created if oldest is None else min(oldest, created)
+        return {
+            "running": self._task is not None,
+            "depth": sum(n for _, status, n, _ in counts if status != "dead"),
+            "dead": sum(n for _, status, n, _ in counts if status == "dead"),
+            "by_kind": depth,
+            "lag_s": round(now - oldest, 1) if oldest is not None else 0.0,
+            "delivered_total": self.delivered,
+            "failed_attempts_total": self.failures,
+            "superseded_total": self.superseded,
+            "dead_total": self.dead,
+            "last_error": self.last_error,
+        }
 
-        return result
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"voice processing failed: {e}")
+write_outbox = WriteOutbox(OUTBOX_PATH, OUTBOX_BATCH_SIZE, OUTBOX_MAX_ATTEMPTS, OUTBOX_POLL_INTERVAL_S)
 
 
-# New endpoint for report generation
-@app.post("/generate-report")
-def generate_report(req: GenerateReportRequest):
-    #Fetch inspection from DB
-    resp = (
-        supabase.table("inspections")
-        .select("machine_model, checklist_json")
-        .eq("id", req.inspection_id)
-        .limit(1)
-        .execute()
-    )
+@app.get("/worker/outbox/status")
+def outbox_status():
+    return write_outbox.status()
 
-    rows = resp.data or []
-    if not rows:
-        raise HTTPException(status_code=404, detail="Inspection not found")
 
-    machine_model = rows[0]["machine_model"]
-    checklist = rows[0]["checklist_json"]
+_RISK_LEVELS = ["Low", "Moderate", "High"]
+
 
+def _risk_scores(fails, monitors, nones):
+    """Numeric risk score (0–100) and heuristic risk level (index into _RISK_LEVELS)
+    from FAIL / MONITOR / unchecked counts. Takes ints or numpy arrays of counts."""
+    # Base 100, penalize FAIL and MONITOR, lightly penalize unchecked items, clamp to 0..100
+    scores = np.clip(100 - 10 * np.asarray(fails) - 3 * np.asarray(monitors) - 2 * np.asarray(nones), 0, 100)
+    # Any FAIL is High, three or more MONITOR is Moderate
+    levels = np.where(np.asarray(fails) > 0, 2, np.where(np.asarray(monitors) >= 3, 1, 0))
+    return scores, levels
+
+
+def _report_breakdown(checklist: dict) -> dict:
+    """Status breakdown, heuristic overall risk and numeric risk score for one checklist."""
     #compute status breakdown
     fail_items = []
     monitor_items = []
@@ -937,31 +2587,124 @@ def generate_report(req: GenerateReportRequest):
         else:
             none_items.append(item)
 
-    #determine overall risk (simple heuristic)
-    overall_risk = "Low"
-    if len(fail_items) > 0:
-        overall_risk = "High"
-    elif len(monitor_items) >= 3:
-        overall_risk = "Moderate"
+    # Overall risk (simple heuristic) and numeric risk score (0–100). Backend is source of truth.
+    score, level = _risk_scores(len(fail_items), len(monitor_items), len(none_items))
+
+    return {
+        "fail_items": fail_items,
+        "monitor_items": monitor_items,
+        "pass_items": pass_items,
+        "none_items": none_items,
+        "overall_risk": _RISK_LEVELS[int(level)],
+        "risk_score": int(score),
+    }
+
 
-    # Compute numeric risk score (0–100). Backend is source of truth.
-    total_items = len(checklist)
+_STATUS_CODES = {"PASS": 1, "MONITOR": 2, "FAIL": 3}  # anything else counts as unchecked (0)
 
-    # Base score
-    risk_score = 100
 
-    # Penalize FAIL and MONITOR
-    risk_score -= len(fail_items) * 10
-    risk_score -= len(monitor_items) * 3
+def _report_breakdowns(checklists: list[dict]) -> list[dict]:
+    """_report_breakdown for many checklists at once: one int8 status matrix
+    (rows = checklists, columns = union of item names), counts and scores by column ops."""
+    if not checklists:
+        return []
+    items = list(dict.fromkeys(k for checklist in checklists for k in checklist))
+    col = {item: j for j, item in enumerate(items)}
+    codes = np.full((len(checklists), len(items)), -1, dtype=np.int8)  # -1: item absent
+    for i, checklist in enumerate(checklists):
+        for item, status in checklist.items():
+            codes[i, col[item]] = _STATUS_CODES.get(status, 0)
+
+    fails = (codes == 3).sum(axis=1)
+    monitors = (codes == 2).sum(axis=1)
+    nones = (codes == 0).sum(axis=1)
+    scores, levels = _risk_scores(fails, monitors, nones)
+
+    names = np.array(items, dtype=object)
+    out = []
+    for i in range(len(checklists)):
+        row = codes[i]
+        out.append({
+            "fail_items": names[row == 3].tolist(),
+            "monitor_items": names[row == 2].tolist(),
+            "pass_items": names[row == 1].tolist(),
+            "none_items": names[row == 0].tolist(),
+            "overall_risk": _RISK_LEVELS[levels[i]],
+            "risk_score": int(scores[i]),
+        })
+    return out
+
+
+# Reports are stored with inspection_reports.content_hash (text, nullable;
+# older rows without it simply miss). Bump REPORT_PROMPT_VERSION whenever
+# _build_report_prompt or the report model changes so stored reports regenerate.
+REPORT_PROMPT_VERSION = "report-v1"
+report_cache_stats = {"hits": 0, "misses": 0, "refreshes": 0}
+
+
+def _report_content_hash(machine_model: Optional[str], checklist: dict) -> str:
+    """Content address of a report: machine model, checklist state and prompt version."""
+    payload = json.dumps(
+        {"prompt": REPORT_PROMPT_VERSION, "machine_model": machine_model, "checklist": checklist},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
 
-    # Optional: lightly penalize unchecked items
-    risk_score -= len(none_items) * 2
 
-    # Clamp between 0 and 100
-    risk_score = max(0, min(100, risk_score))
+def _stored_report(inspection_id: str, content_hash: str) -> Optional[dict]:
+    """The stored report for this inspection if it was generated from identical content."""
+    # A report still waiting in the outbox is newer than whatever the table holds
+    pending = write_outbox.pending_payload("report_upsert", inspection_id)
+    if pending is not None:
+        return pending["report_json"] if pending.get("content_hash") == content_hash else None
+
+    try:
+        resp = (
+            supabase.table("inspection_reports")
+            .select("report_json, content_hash")
+            .eq("inspection_id", inspection_id)
+            .limit(1)
+            .execute()
+        )
+    except Exception as e:
+        print("Report cache lookup failed:", e)
+        return None
+    rows = resp.data or []
+    if rows and rows[0].get("content_hash") == content_hash:
+        return rows[0]["report_json"]
+    return None
+
+
+def _cached_report(inspection_id: str, content_hash: str, force_refresh: bool) -> tuple[Optional[dict], str]:
+    """(stored report or None, cache status: hit / miss / refresh)."""
+    if force_refresh:
+        report_cache_stats["refreshes"] += 1
+        return None, "refresh"
+    report = _stored_report(inspection_id, content_hash)
+    if report is None:
+        report_cache_stats["misses"] += 1
+        return None, "miss"
+    report_cache_stats["hits"] += 1
+    return report, "hit"
+
+
+@app.get("/debug/report-cache")
+def debug_report_cache():
+    lookups = report_cache_stats["hits"] + report_cache_stats["misses"]
+    return {
+        **report_cache_stats,
+        "prompt_version": REPORT_PROMPT_VERSION,
+        "hit_rate": round(report_cache_stats["hits"] / lookups, 4) if lookups else None,
+    }
+
+
+def _build_report_prompt(machine_model: str, breakdown: dict) -> str:
+    fail_items = breakdown["fail_items"]
+    monitor_items = breakdown["monitor_items"]
 
     #Build prompt for report generation
-    prompt_text = f"""
+    return f"""
     You are generating a professional Caterpillar equipment inspection report aligned with standard inspection documentation.
 
     Machine Model: {machine_model}
@@ -969,8 +2712,8 @@ def generate_report(req: GenerateReportRequest):
     Summary counts:
     - FAIL: {len(fail_items)}
     - MONITOR: {len(monitor_items)}
-    - PASS: {len(pass_items)}
-    - NOT CHECKED: {len(none_items)}
+    - PASS: {len(breakdown["pass_items"])}
+    - NOT CHECKED: {len(breakdown["none_items"])}
 
     FAIL Items:
     {fail_items}
@@ -995,9 +2738,72 @@ def generate_report(req: GenerateReportRequest):
     - Set overall_risk to one of Low/Moderate/High.
     - Return ONLY valid JSON.
 
-    Suggested overall_risk: {overall_risk}
+    Suggested overall_risk: {breakdown["overall_risk"]}
     """
 
+
+def _persist_report(
+    inspection_id: str, machine_model: Optional[str], report: dict, breakdown: dict, content_hash: str
+) -> None:
+    """Queue the inspection_reports upsert and the memory summary on the write outbox."""
+    # Full report JSON goes to Supabase (Archive source of truth), addressed by content
+    write_outbox.enqueue(
+        "report_upsert",
+        {"inspection_id": inspection_id, "report_json": report, "content_hash": content_hash},
+        dedupe_key=inspection_id,
+    )
+
+    # Summary form for memory. Supabase remains source-of-truth.
+    machine_id = machine_model or "unknown"
+    overall = report.get("overall_risk", breakdown["overall_risk"])
+
+    critical = report.get("critical_findings", []) or []
+    recs = report.get("recommendations", []) or []
+
+    summary = (
+        f"Inspection {inspection_id} for {machine_id}\n"
+        f"Overall Risk: {overall} | Risk Score: {breakdown['risk_score']}\n"
+        f"FAIL count: {len(breakdown['fail_items'])} | MONITOR count: {len(breakdown['monitor_items'])} | PASS count: {len(breakdown['pass_items'])}\n"
+        f"Critical: {', '.join(critical[:3])}\n"
+        f"Recommendations: {', '.join(recs[:3])}"
+    )
+    # Keyed per inspection so a regenerated report replaces the old summary
+    key = f"report:{inspection_id}"
+    write_outbox.enqueue(
+        "memory_add",
+        {"content": summary, "tags": _machine_tags(machine_id), "key": key},
+        dedupe_key=key,
+    )
+
+
+# New endpoint for report generation
+@app.post("/generate-report")
+def generate_report(req: GenerateReportRequest):
+    #Fetch inspection from DB
+    resp = (
+        supabase.table("inspections")
+        .select("machine_model, checklist_json")
+        .eq("id", req.inspection_id)
+        .limit(1)
+        .execute()
+    )
+
+    rows = resp.data or []
+    if not rows:
+        raise HTTPException(status_code=404, detail="Inspection not found")
+
+    machine_model = rows[0]["machine_model"]
+    checklist = rows[0]["checklist_json"]
+
+    # Unchanged checklist: return the stored report without a model call
+    content_hash = _report_content_hash(machine_model, checklist)
+    cached, cache_status = _cached_report(req.inspection_id, content_hash, req.force_refresh)
+    if cached is not None:
+        return {**cached, "report_cache": cache_status}
+
+    breakdown = _report_breakdown(checklist)
+    prompt_text = _build_report_prompt(machine_model, breakdown)
+
     try:
         chat = client.chat.completions.create(
             model="gpt-4.1-mini",
@@ -1021,120 +2827,1170 @@ def generate_report(req: GenerateReportRequest):
 
     try:
         report = json.loads(content)
-        report["risk_score"] = risk_score
+        report["risk_score"] = breakdown["risk_score"]
+
+        _persist_report(req.inspection_id, machine_model, report, breakdown, content_hash)
+
+        return {**report, "report_cache": cache_status}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Report generation returned invalid JSON: {e}. Raw: {content[:400]}"
+        )
+
 
-        # Save full report JSON to Supabase (Archive source of truth)
+@app.post("/generate-report/stream")
+async def generate_report_stream(req: GenerateReportRequest):
+    """SSE variant of /generate-report.
+
+    Events arrive in this order: `breakdown` (counts and risk score, computed
+    locally, so it comes first), `summary_delta` chunks of the executive
+    summary as the model writes it, then `report` with the full report. The
+    report is persisted once the stream completes. When the stored report
+    matches the current checklist, `report` follows `breakdown` directly.
+    """
+    row = await _fetch_inspection(req.inspection_id, "machine_model, checklist_json")
+    machine_model = row["machine_model"]
+    content_hash = _report_content_hash(machine_model, row["checklist_json"])
+    cached, cache_status = await asyncio.to_thread(
+        _cached_report, req.inspection_id, content_hash, req.force_refresh
+    )
+    breakdown = _report_breakdown(row["checklist_json"])
+    prompt_text = _build_report_prompt(machine_model, breakdown)
+
+    async def events():
+        yield _sse("breakdown", {
+            "overall_risk": breakdown["overall_risk"],
+            "risk_score": breakdown["risk_score"],
+            "counts": {
+                "FAIL": len(breakdown["fail_items"]),
+                "MONITOR": len(breakdown["monitor_items"]),
+                "PASS": len(breakdown["pass_items"]),
+                "NOT_CHECKED": len(breakdown["none_items"]),
+            },
+            "fail_items": breakdown["fail_items"],
+            "monitor_items": breakdown["monitor_items"],
+        })
+        if cached is not None:
+            yield _sse("report", {**cached, "report_cache": cache_status})
+            return
+
+        content = ""
+        sent = 0
         try:
-            supabase.table("inspection_reports").upsert(
-                {
-                    "inspection_id": req.inspection_id,
-                    "report_json": report,
-                },
-                on_conflict="inspection_id",
-            ).execute()
+            stream = await aclient.chat.completions.create(
+                model="gpt-4.1-mini",
+                messages=[{"role": "user", "content": prompt_text}],
+                response_format={"type": "json_object"},
+                temperature=0,
+                stream=True,
+            )
+            async for chunk in stream:
+                if not (chunk.choices and chunk.choices[0].delta.content):
+                    continue
+                content += chunk.choices[0].delta.content
+                summary = _partial_json_string(content, "executive_summary")
+                if summary is not None and len(summary[0]) > sent:
+                    yield _sse("summary_delta", {"text": summary[0][sent:]})
+                    sent = len(summary[0])
+
+            report = json.loads(content)
+            report["risk_score"] = breakdown["risk_score"]
+            _persist_report(req.inspection_id, machine_model, report, breakdown, content_hash)
+            yield _sse("report", {**report, "report_cache": cache_status})
         except Exception as e:
-            print("Supabase upsert (inspection_reports) failed:", e)
+            yield _sse("error", {"error": f"Report generation failed: {e}", "raw": content[:400]})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=_SSE_HEADERS)
+
 
-        # Store to Supermemory (summary form). Supabase remains source-of-truth.
+# -----------------------------
+# Bulk report generation
+# -----------------------------
+
+# One call for a whole yard: the checklists come back in one query, breakdowns
+# are computed in one vectorized pass, stored reports are reused (same content
+# hash as /generate-report) and only the remaining summaries go to the model,
+# through their own pool of BULK_REPORT_CONCURRENCY calls spaced to at most
+# BULK_REPORT_RPM per minute so a bulk job can't starve interactive traffic.
+# A date range matching more than BULK_REPORT_MAX_ITEMS inspections covers the
+# oldest ones; the `start` line reports `matched` and `truncated` so the
+# caller can continue from the last created_at.
+BULK_REPORT_MAX_ITEMS = int(os.getenv("BULK_REPORT_MAX_ITEMS", "500"))
+BULK_REPORT_CONCURRENCY = int(os.getenv("BULK_REPORT_CONCURRENCY", "4"))
+BULK_REPORT_RPM = float(os.getenv("BULK_REPORT_RPM", "120"))
+BULK_REPORT_MAX_ATTEMPTS = int(os.getenv("BULK_REPORT_MAX_ATTEMPTS", "3"))
+BULK_REPORT_RETRY_BASE_S = float(os.getenv("BULK_REPORT_RETRY_BASE_S", "2"))
+
+
+class BulkReportRequest(BaseModel):
+    # Either explicit ids, or a created_at range [created_from, created_to) as ISO timestamps
+    inspection_ids: Optional[list[str]] = None
+    created_from: Optional[str] = None
+    created_to: Optional[str] = None
+    force_refresh: bool = False
+
+
+class RateLimiter:
+    """Spaces acquisitions at least 60/rpm seconds apart (across all callers)."""
+
+    def __init__(self, rpm: float):
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+_bulk_report_slots = asyncio.Semaphore(BULK_REPORT_CONCURRENCY)
+bulk_report_limiter = RateLimiter(BULK_REPORT_RPM)
+
+
+async def _fetch_inspections_for_reports(req: BulkReportRequest) -> tuple[list[str], dict[str, dict], int]:
+    """(requested ids in order, rows by id, inspections matched). Ids without a row are
+    simply absent from the dict; for a date range, matched can exceed BULK_REPORT_MAX_ITEMS."""
+    columns = "id, machine_model, checklist_json"
+    if req.inspection_ids:
+        ids = list(dict.fromkeys(req.inspection_ids))
+        rows: dict[str, dict] = {}
+        for i in range(0, len(ids), MEDIA_IN_CHUNK):
+            resp = await (
+                asupabase.table("inspections")
+                .select(columns)
+                .in_("id", ids[i:i + MEDIA_IN_CHUNK])
+                .execute()
+            )
+            rows.update({r["id"]: r for r in resp.data or []})
+        return ids, rows, len(ids)
+
+    query = asupabase.table("inspections").select(columns, count="exact")
+    if req.created_from:
+        query = query.gte("created_at", req.created_from)
+    if req.created_to:
+        query = query.lt("created_at", req.created_to)
+    resp = await query.order("created_at", desc=False).limit(BULK_REPORT_MAX_ITEMS).execute()
+    data = resp.data or []
+    matched = resp.count if resp.count is not None else len(data)
+    return [r["id"] for r in data], {r["id"]: r for r in data}, matched
+
+
+async def _stored_reports_many(content_hashes: dict[str, str]) -> dict[str, dict]:
+    """Bulk _stored_report: inspection_id -> stored report whose content hash still matches."""
+    found: dict[str, dict] = {}
+    to_query: list[str] = []
+    for inspection_id, content_hash in content_hashes.items():
+        pending = write_outbox.pending_payload("report_upsert", inspection_id)
+        if pending is None:
+            to_query.append(inspection_id)
+        elif pending.get("content_hash") == content_hash:
+            found[inspection_id] = pending["report_json"]
+
+    for i in range(0, len(to_query), MEDIA_IN_CHUNK):
         try:
-            machine_id = machine_model or "unknown"
-            tags = _machine_tags(machine_id)
-            overall = report.get("overall_risk", overall_risk)
-
-            critical = report.get("critical_findings", []) or []
-            recs = report.get("recommendations", []) or []
-
-            summary = (
-                f"Inspection {req.inspection_id} for {machine_id}\n"
-                f"Overall Risk: {overall} | Risk Score: {risk_score}\n"
-                f"FAIL count: {len(fail_items)} | MONITOR count: {len(monitor_items)} | PASS count: {len(pass_items)}\n"
-                f"Critical: {', '.join(critical[:3])}\n"
-                f"Recommendations: {', '.join(recs[:3])}"
+            resp = await (
+                asupabase.table("inspection_reports")
+                .select("inspection_id, content_hash, report_json")
+                .in_("inspection_id", to_query[i:i + MEDIA_IN_CHUNK])
+                .execute()
             )
-            sm_add_memory(summary, tags)
         except Exception as e:
-            print("Supermemory store (generate-report) failed:", e)
+            print("Report cache lookup failed:", e)
+            continue
+        for r in resp.data or []:
+            if r.get("content_hash") == content_hashes.get(r["inspection_id"]):
+                found[r["inspection_id"]] = r["report_json"]
+    return found
+
+
+async def _generate_report_async(machine_model: Optional[str], breakdown: dict) -> dict:
+    prompt_text = _build_report_prompt(machine_model, breakdown)
+    chat = await aclient.chat.completions.create(
+        model="gpt-4.1-mini",
+        messages=[{"role": "user", "content": prompt_text}],
+        response_format={"type": "json_object"},
+        temperature=0,
+    )
+    report = json.loads(chat.choices[0].message.content or "")
+    report["risk_score"] = breakdown["risk_score"]
+    return report
+
+
+async def _bulk_report_item(row: dict, breakdown: dict, content_hash: str, cache_status: str) -> dict:
+    """Generate and persist one report; errors come back as an `error` line instead of raising."""
+    inspection_id = row["id"]
+    t0 = time.perf_counter()
+    async with _bulk_report_slots:
+        attempt = 0
+        while True:
+            attempt += 1
+            await bulk_report_limiter.acquire()
+            try:
+                report = await _generate_report_async(row.get("machine_model"), breakdown)
+                break
+            except Exception as e:
+                if attempt >= BULK_REPORT_MAX_ATTEMPTS or not _is_retryable(e):
+                    return {
+                        "type": "error",
+                        "inspection_id": inspection_id,
+                        "error": f"{type(e).__name__}: {e}",
+                        "attempts": attempt,
+                    }
+                await asyncio.sleep(BULK_REPORT_RETRY_BASE_S * 2 ** (attempt - 1))
+
+    _persist_report(inspection_id, row.get("machine_model"), report, breakdown, content_hash)
+    return {
+        "type": "report",
+        "inspection_id": inspection_id,
+        "report_cache": cache_status,
+        "report": report,
+        "attempts": attempt,
+        "ms": _ms_since(t0),
+    }
 
-        return report
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Report generation returned invalid JSON: {e}. Raw: {content[:400]}"
+
+def _ndjson(obj: dict) -> str:
+    return json.dumps(obj) + "\n"
+
+
+@app.post("/generate-report/bulk")
+async def generate_report_bulk(req: BulkReportRequest):
+    """Reports for many inspections, streamed as NDJSON in completion order.
+
+    Lines: `start` (totals, and whether a date range was truncated), then one `report` or `error` per inspection as it
+    finishes (stored reports first), then `summary`. A failing item never
+    aborts the batch.
+    """
+    if not req.inspection_ids and not (req.created_from or req.created_to):
+        raise HTTPException(status_code=400, detail="Provide inspection_ids or a created_from/created_to range")
+    if req.inspection_ids and len(set(req.inspection_ids)) > BULK_REPORT_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_REPORT_MAX_ITEMS} inspections per request")
+
+    t0 = time.perf_counter()
+    ids, rows, matched = await _fetch_inspections_for_reports(req)
+    found = [rows[i] for i in ids if i in rows]
+    breakdowns = dict(zip((r["id"] for r in found), _report_breakdowns([r["checklist_json"] or {} for r in found])))
+    hashes = {r["id"]: _report_content_hash(r.get("machine_model"), r["checklist_json"] or {}) for r in found}
+
+    stored = {} if req.force_refresh else await _stored_reports_many(hashes)
+    cache_status = "refresh" if req.force_refresh else "miss"
+    report_cache_stats["refreshes" if req.force_refresh else "misses"] += len(found) - len(stored)
+    report_cache_stats["hits"] += len(stored)
+
+    async def events():
+        counts = {"report": 0, "error": 0}
+        yield _ndjson({
+            "type": "start",
+            "total": len(ids),
+            "matched": matched,
+            "truncated": matched > len(ids),
+            "cached": len(stored),
+            "to_generate": len(found) - len(stored),
+            "fetch_ms": _ms_since(t0),
+        })
+        for inspection_id in ids:
+            if inspection_id not in rows:
+                counts["error"] += 1
+                yield _ndjson({"type": "error", "inspection_id": inspection_id, "error": "Inspection not found"})
+            elif inspection_id in stored:
+                counts["report"] += 1
+                yield _ndjson({
+                    "type": "report",
+                    "inspection_id": inspection_id,
+                    "report_cache": "hit",
+                    "report": stored[inspection_id],
+                })
+
+        tasks = [
+            asyncio.create_task(_bulk_report_item(r, breakdowns[r["id"]], hashes[r["id"]], cache_status))
+            for r in found
+            if r["id"] not in stored
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                counts[line["type"]] += 1
+                yield _ndjson(line)
+        finally:
+            # Client went away: don't keep spending tokens on the rest
+            for task in tasks:
+                task.cancel()
+
+        yield _ndjson({"type": "summary", **counts, "total": len(ids), "elapsed_ms": _ms_since(t0)})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson", headers=_SSE_HEADERS)
+
+
+# -----------------------------
+# Fleet analytics
+# -----------------------------
+
+# Fleet-wide dashboard numbers computed from an in-memory int8 status matrix
+# (one row per inspection, one column per checklist item; -1 = item absent,
+# 0 unchecked, 1 PASS, 2 MONITOR, 3 FAIL). The matrix is filled by keyset
+# pagination over inspections (created_at, id), with each page's report risk
+# fetched in bulk from inspection_reports. Polls within FLEET_ANALYTICS_TTL_S
+# are served from the cached result. After that an incremental refresh
+# re-reads only inspections created since the cursor or within
+# FLEET_RESCAN_WINDOW_S (checklists are still edited shortly after creation),
+# and a full rebuild happens every FLEET_FULL_REFRESH_S.
+FLEET_PAGE_SIZE = int(os.getenv("FLEET_PAGE_SIZE", "1000"))
+FLEET_ANALYTICS_TTL_S = float(os.getenv("FLEET_ANALYTICS_TTL_S", "60"))
+FLEET_RESCAN_WINDOW_S = float(os.getenv("FLEET_RESCAN_WINDOW_S", str(2 * 24 * 3600)))
+FLEET_FULL_REFRESH_S = float(os.getenv("FLEET_FULL_REFRESH_S", str(6 * 3600)))
+
+_TREND_BUCKETS_S = {"day": 86400, "week": 7 * 86400}
+
+
+def _parse_ts(value: Any) -> float:
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return 0.0
+
+
+async def _iter_inspection_pages(created_gte: Optional[str], page_size: int):
+    """Keyset-paginate inspections by (created_at, id); each row gets `report_risk` from inspection_reports."""
+    after: Optional[tuple[str, str]] = None
+    while True:
+        query = asupabase.table("inspections").select("id, machine_model, checklist_json, created_at")
+        if created_gte:
+            query = query.gte("created_at", created_gte)
+        if after is not None:
+            ts, last_id = after
+            query = query.or_(f'created_at.gt."{ts}",and(created_at.eq."{ts}",id.gt."{last_id}")')
+        resp = await query.order("created_at").order("id").limit(page_size).execute()
+        page = resp.data or []
+        if not page:
+            return
+
+        ids = [r["id"] for r in page]
+        report_risk: dict[str, Optional[str]] = {}
+        for i in range(0, len(ids), MEDIA_IN_CHUNK):
+            reports = await (
+                asupabase.table("inspection_reports")
+                .select("inspection_id, overall_risk:report_json->>overall_risk")
+                .in_("inspection_id", ids[i:i + MEDIA_IN_CHUNK])
+                .execute()
+            )
+            report_risk.update({r["inspection_id"]: r.get("overall_risk") for r in reports.data or []})
+        for r in page:
+            r["report_risk"] = report_risk.get(r["id"])
+
+        yield page
+        if len(page) < page_size:
+            return
+        after = (page[-1]["created_at"], page[-1]["id"])
+
+
+class FleetAnalytics:
+    """Status matrix of the fleet's inspections plus the aggregations served by /analytics/fleet."""
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._reset()
+        self.refreshed_at: Optional[float] = None
+        self.full_refreshed_at: Optional[float] = None
+        self.last_refresh: dict = {}
+        self._summaries: dict[tuple, dict] = {}
+
+    def _reset(self) -> None:
+        self.codes = np.full((0, 0), -1, dtype=np.int8)
+        self.items: list[str] = []
+        self._item_col: dict[str, int] = {}
+        self.models: list[str] = []
+        self._model_idx: dict[str, int] = {}
+        self.row_model = np.zeros(0, dtype=np.int32)
+        self.row_created = np.zeros(0, dtype=np.float64)
+        self.row_report_risk = np.zeros(0, dtype=np.int8)  # -1 = no report
+        self._row_of: dict[str, int] = {}
+        self.n = 0
+        self._cursor: Optional[str] = None  # max created_at seen
+
+    def _ensure_capacity(self, rows: int, cols: int) -> None:
+        cap_rows, cap_cols = self.codes.shape
+        if rows <= cap_rows and cols <= cap_cols:
+            return
+        new_rows = max(rows, cap_rows * 2 if rows > cap_rows else cap_rows, 64)
+        new_cols = max(cols, cap_cols)
+        grown = np.full((new_rows, new_cols), -1, dtype=np.int8)
+        grown[:cap_rows, :cap_cols] = self.codes
+        self.codes = grown
+        for name, fill in (("row_model", 0), ("row_created", 0.0), ("row_report_risk", -1)):
+            old = getattr(self, name)
+            arr = np.full(new_rows, fill, dtype=old.dtype)
+            arr[:len(old)] = old
+            setattr(self, name, arr)
+
+    def _upsert(self, page: list[dict]) -> int:
+        """Encode a page of rows into the matrix (new ids append, known ids overwrite). Returns rows added."""
+        for r in page:
+            for item in (r.get("checklist_json") or {}):
+                if item not in self._item_col:
+                    self._item_col[item] = len(self.items)
+                    self.items.append(item)
+        added = sum(1 for r in page if r["id"] not in self._row_of)
+        self._ensure_capacity(self.n + added, len(self.items))
+
+        for r in page:
+            i = self._row_of.get(r["id"])
+            if i is None:
+                i = self._row_of[r["id"]] = self.n
+                self.n += 1
+            model = r.get("machine_model") or "unknown"
+            if model not in self._model_idx:
+                self._model_idx[model] = len(self.models)
+                self.models.append(model)
+            row = self.codes[i]
+            row[:] = -1
+            for item, status in (r.get("checklist_json") or {}).items():
+                row[self._item_col[item]] = _STATUS_CODES.get(status, 0)
+            self.row_model[i] = self._model_idx[model]
+            self.row_created[i] = _parse_ts(r.get("created_at"))
+            risk = r.get("report_risk")
+            self.row_report_risk[i] = _RISK_LEVELS.index(risk) if risk in _RISK_LEVELS else -1
+            if self._cursor is None or str(r.get("created_at")) > self._cursor:
+                self._cursor = str(r.get("created_at"))
+        return added
+
+    async def refresh(self, full: bool = False, only_if_stale: bool = False) -> None:
+        async with self._lock:
+            now = time.time()
+            if only_if_stale and self.refreshed_at is not None and now - self.refreshed_at <= FLEET_ANALYTICS_TTL_S:
+                return  # another poll refreshed while we waited for the lock
+            if self.full_refreshed_at is None or now - self.full_refreshed_at > FLEET_FULL_REFRESH_S:
+                full = True
+            if full:
+                self._reset()
+                since = None
+            else:
+                # New rows (after the cursor) plus recent rows whose checklists may still change
+                window_start = _utc_iso(now - FLEET_RESCAN_WINDOW_S)
+                since = min(self._cursor, window_start) if self._cursor else window_start
+
+            t0 = time.perf_counter()
+            pages = rows = added = 0
+            async for page in _iter_inspection_pages(since, FLEET_PAGE_SIZE):
+                pages += 1
+                rows += len(page)
+                added += self._upsert(page)
+
+            self.refreshed_at = time.time()
+            if full:
+                self.full_refreshed_at = self.refreshed_at
+            self.last_refresh = {
+                "mode": "full" if full else "incremental",
+                "pages": pages,
+                "rows_read": rows,
+                "rows_added": added,
+                "ms": _ms_since(t0),
+            }
+            self._summaries.clear()
+
+    async def summary(self, top_n: int, bucket: str, refresh: Optional[str]) -> dict:
+        stale = self.refreshed_at is None or time.time() - self.refreshed_at > FLEET_ANALYTICS_TTL_S
+        if refresh or stale:
+            await self.refresh(full=refresh == "full", only_if_stale=not refresh)
+        key = (top_n, bucket)
+        if key not in self._summaries:
+            self._summaries[key] = self._aggregate(top_n, bucket)
+        return {
+            **self._summaries[key],
+            "cache": {
+                "refreshed_at": _utc_iso(self.refreshed_at),
+                "age_s": round(time.time() - self.refreshed_at, 1),
+                "ttl_s": FLEET_ANALYTICS_TTL_S,
+                "last_refresh": self.last_refresh,
+            },
+        }
+
+    def _aggregate(self, top_n: int, bucket: str) -> dict:
+        n = self.n
+        codes = self.codes[:n, :len(self.items)]
+        models = self.row_model[:n]
+        created = self.row_created[:n]
+        items = np.array(self.items, dtype=object)
+        if n == 0:
+            return {"inspections": 0}
+
+        # Same scoring as _report_breakdown, for every inspection at once
+        fails = (codes == 3).sum(axis=1)
+        monitors = (codes == 2).sum(axis=1)
+        nones = (codes == 0).sum(axis=1)
+        scores, heuristic_risk = _risk_scores(fails, monitors, nones)
+
+        hist, edges = np.histogram(scores, bins=10, range=(0, 100))
+        risk_counts = np.bincount(heuristic_risk, minlength=3)
+        reported = self.row_report_risk[:n]
+        reported_counts = np.bincount(reported[reported >= 0], minlength=3)
+
+        # Most-failed items: FAIL count and rate among inspections that have the item
+        fail_counts = (codes == 3).sum(axis=0)
+        present = (codes >= 0).sum(axis=0)
+        top = np.argsort(-fail_counts, kind="stable")[:top_n]
+        most_failed = [
+            {
+                "item": items[j],
+                "fail_count": int(fail_counts[j]),
+                "fail_rate": round(float(fail_counts[j] / present[j]), 4) if present[j] else None,
+            }
+            for j in top
+            if fail_counts[j] > 0
+        ]
+
+        # MONITOR -> FAIL: consecutive inspections of the same machine model
+        # (machine_model is the machine id for MVP), ordered by time
+        order = np.lexsort((created, models))
+        seq = codes[order]
+        same_machine = models[order][1:] == models[order][:-1]
+        was_monitor = (seq[:-1] == 2) & same_machine[:, None]
+        to_fail = was_monitor & (seq[1:] == 3)
+        monitor_next = was_monitor.sum(axis=0)
+        transitions = to_fail.sum(axis=0)
+        top_t = np.argsort(-transitions, kind="stable")[:top_n]
+        total_monitor_next = int(monitor_next.sum())
+
+        # Per-model counts, scores and fail rates, plus a score trend per time bucket
+        n_models = len(self.models)
+        per_model_count = np.bincount(models, minlength=n_models)
+        per_model_score = np.bincount(models, weights=scores, minlength=n_models)
+        per_model_failing = np.bincount(models, weights=(fails > 0), minlength=n_models)
+
+        width = _TREND_BUCKETS_S.get(bucket, _TREND_BUCKETS_S["week"])
+        buckets = (created // width).astype(np.int64)
+        pairs, inverse = np.unique(np.stack([models.astype(np.int64), buckets]), axis=1, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        pair_count = np.bincount(inverse)
+        pair_score = np.bincount(inverse, weights=scores)
+        trends: dict[str, list[dict]] = {m: [] for m in self.models}
+        for k in range(pairs.shape[1]):
+            trends[self.models[pairs[0, k]]].append({
+                "bucket_start": _utc_iso(float(pairs[1, k] * width)),
+                "inspections": int(pair_count[k]),
+                "avg_risk_score": round(float(pair_score[k] / pair_count[k]), 1),
+            })
+
+        per_model = sorted(
+            (
+                {
+                    "machine_model": self.models[m],
+                    "inspections": int(per_model_count[m]),
+                    "avg_risk_score": round(float(per_model_score[m] / per_model_count[m]), 1),
+                    "share_with_fail": round(float(per_model_failing[m] / per_model_count[m]), 4),
+                    "trend": trends[self.models[m]],
+                }
+                for m in range(n_models)
+                if per_model_count[m]
+            ),
+            key=lambda x: -x["inspections"],
         )
+
+        return {
+            "inspections": n,
+            "items": len(self.items),
+            "risk_score": {
+                "mean": round(float(scores.mean()), 1),
+                "p10": float(np.percentile(scores, 10)),
+                "median": float(np.median(scores)),
+                "p90": float(np.percentile(scores, 90)),
+                "histogram": [
+                    {"from": int(edges[b]), "to": int(edges[b + 1]), "count": int(hist[b])} for b in range(len(hist))
+                ],
+            },
+            "overall_risk": {level: int(risk_counts[i]) for i, level in enumerate(_RISK_LEVELS)},
+            "reported_overall_risk": {level: int(reported_counts[i]) for i, level in enumerate(_RISK_LEVELS)},
+            "reports": int((reported >= 0).sum()),
+            "most_failed_items": most_failed,
+            "monitor_to_fail": {
+                "transitions": int(transitions.sum()),
+                "monitor_followups": total_monitor_next,
+                "rate": round(int(transitions.sum()) / total_monitor_next, 4) if total_monitor_next else None,
+                "top_items": [
+                    {
+                        "item": items[j],
+                        "transitions": int(transitions[j]),
+                        "rate": round(float(transitions[j] / monitor_next[j]), 4) if monitor_next[j] else None,
+                    }
+                    for j in top_t
+                    if transitions[j] > 0
+                ],
+            },
+            "per_model": per_model,
+        }
+
+
+fleet_analytics = FleetAnalytics()
+
+
+@app.get("/analytics/fleet")
+async def analytics_fleet(top_n: int = 10, bucket: Literal["day", "week"] = "week", refresh: Optional[Literal["incremental", "full"]] = None):
+    """Fleet risk dashboard: score distribution, most-failed items, MONITOR->FAIL transitions, per-model trends.
+
+    Cached for FLEET_ANALYTICS_TTL_S; `refresh` forces an incremental or full reload.
+    """
+    return await fleet_analytics.summary(max(1, min(top_n, 100)), bucket, refresh)
 # -----------------------------
 # Machine Sound Health (GOOD/BAD)
 # -----------------------------
 
-def _download_media_bytes(media_id: str) -> tuple[dict, bytes]:
-    """Retrieve a media record and download its content from Supabase public storage."""
+# sound_baselines columns beyond machine_id/mode/feature_mean/feature_std/threshold:
+# n_good, feature_m2 and clip_scores hold the running stats for
+# /sound/baseline/update, and updated_at is the version BaselineCache
+# revalidates against. The trigger keeps updated_at moving even for writes
+# that don't set it (manual edits, other tools):
+#
+#   ALTER TABLE sound_baselines
+#     ADD COLUMN IF NOT EXISTS n_good integer,
+#     ADD COLUMN IF NOT EXISTS feature_m2 jsonb,
+#     ADD COLUMN IF NOT EXISTS clip_scores jsonb,
+#     ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT now();
+#
+#   CREATE OR REPLACE FUNCTION sound_baselines_touch() RETURNS trigger AS $$
+#   BEGIN
+#     IF NEW.updated_at IS NOT DISTINCT FROM OLD.updated_at THEN
+#       NEW.updated_at := now();
+#     END IF;
+#     RETURN NEW;
+#   END $$ LANGUAGE plpgsql;
+#
+#   CREATE TRIGGER sound_baselines_touch BEFORE UPDATE ON sound_baselines
+#     FOR EACH ROW EXECUTE FUNCTION sound_baselines_touch();
+#
+# Rows written before the migration have NULL n_good/feature_m2 and need one
+# /sound/baseline/rebuild before /sound/baseline/update accepts them.
+
+# Process pool for MFCC extraction. Callers submit clips in batches of
+# SOUND_BATCH_SIZE; at most SOUND_QUEUE_MAX clips may be queued or running at
+# once. A request that can't get room within SOUND_QUEUE_WAIT_S receives a 503
+# instead of growing the queue without bound. SOUND_WORKERS=0 extracts inline
+# on a thread, which is handy for local dev.
+SOUND_WORKERS = int(os.getenv("SOUND_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+SOUND_BATCH_SIZE = int(os.getenv("SOUND_BATCH_SIZE", "4"))
+SOUND_QUEUE_MAX = int(os.getenv("SOUND_QUEUE_MAX", "64"))
+SOUND_QUEUE_WAIT_S = float(os.getenv("SOUND_QUEUE_WAIT_S", "30"))
+
+
+class FeatureExtractionPool:
+    """Warm process pool that fingerprints clips in batches, with queue backpressure."""
+
+    def __init__(self, workers: int, batch_size: int, queue_max: int, queue_wait_s: float):
+        self.workers = workers
+        self.batch_size = max(1, batch_size)
+        self.queue_max = max(1, queue_max)
+        self.queue_wait_s = queue_wait_s
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._cond = asyncio.Condition()
+        self._pending = 0
+        self.submitted = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        if self.workers <= 0 or self._executor is not None:
+            return
+        # spawn, not fork: the parent holds an event loop and client threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=warm_worker,
+        )
+        # Workers start lazily; submit one no-op each so they are warm before the first request
+        for _ in range(self.workers):
+            self._executor.submit(extract_batch, [])
 
-    media_result = (
-        supabase.table("media")
-        .select("id,bucket,path,category,type,status,machine_id,session_id")
-        .eq("id", media_id)
-        .limit(1)
-        .execute()
-    )
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
 
-    media_rows = media_result.data or []
-    if not media_rows:
-        raise HTTPException(status_code=404, detail="media_id not found")
+    async def _reserve(self, n: int) -> None:
+        async with self._cond:
+            try:
+                await asyncio.wait_for(
+                    self._cond.wait_for(lambda: self._pending == 0 or self._pending + n <= self.queue_max),
+                    timeout=self.queue_wait_s,
+                )
+            except asyncio.TimeoutError:
+                self.rejected += n
+                raise HTTPException(status_code=503, detail="Sound feature queue is full, retry shortly")
+            self._pending += n
+
+    async def _release(self, n: int) -> None:
+        async with self._cond:
+            self._pending -= n
+            self._cond.notify_all()
+
+    async def _run_batch(self, batch: list[tuple[bytes, str]]) -> list[tuple[Optional[np.ndarray], Optional[str]]]:
+        await self._reserve(len(batch))
+        try:
+            self.submitted += len(batch)
+            if self._executor is None:
+                return await asyncio.to_thread(extract_batch, batch)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, extract_batch, batch)
+        finally:
+            await self._release(len(batch))
+
+    async def extract(self, clips: list[tuple[bytes, str]]) -> list[tuple[Optional[np.ndarray], Optional[str]]]:
+        """Fingerprint (audio bytes, extension) clips; returns (features, error) per clip in order."""
+        batches = [clips[i:i + self.batch_size] for i in range(0, len(clips), self.batch_size)]
+        results = await asyncio.gather(*(self._run_batch(b) for b in batches))
+        return [item for batch in results for item in batch]
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": self._executor is not None,
+            "batch_size": self.batch_size,
+            "queue_max": self.queue_max,
+            "pending": self._pending,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+        }
 
-    media_record = media_rows[0]
-    file_url = public_storage_url(media_record["bucket"], media_record["path"])
 
-    response = requests.get(file_url, timeout=60)
+sound_pool = FeatureExtractionPool(SOUND_WORKERS, SOUND_BATCH_SIZE, SOUND_QUEUE_MAX, SOUND_QUEUE_WAIT_S)
 
-    if response.status_code != 200 or not response.content:
-        raise HTTPException(
-            status_code=500,
-            detail=f"download failed: {response.status_code} {response.text[:200]}",
+
+@app.get("/debug/sound-pool")
+def debug_sound_pool():
+    return sound_pool.stats()
+
+
+# Bump whenever extract_mfcc_features changes (n_mfcc, sample rate, pooling),
+# so cached vectors from an older extractor are treated as stale.
+FEATURE_EXTRACTOR_VERSION = "mfcc20-meanstd-sr16000-v1"
+FEATURE_CACHE_PATH = os.getenv("FEATURE_CACHE_PATH", "feature_cache.sqlite3")
+FEATURE_CACHE_MAX_ENTRIES = int(os.getenv("FEATURE_CACHE_MAX_ENTRIES", "50000"))
+
+
+class FeatureCache:
+    """On-disk MFCC feature store (SQLite) keyed by media_id.
+
+    Each row keeps the 40-dim float32 vector, the sha256 of the clip bytes and
+    the extractor version. Rows with another version count as stale misses.
+    When the store grows past `max_entries`, the least recently used 10% is
+    evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int, version: str):
+        self.version = version
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS mfcc_features (
+                media_id TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                version TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS mfcc_features_hash ON mfcc_features (content_hash)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS mfcc_features_lru ON mfcc_features (last_used)")
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def get_many(self, media_ids: list[str]) -> dict[str, np.ndarray]:
+        """Return cached vectors for the given media ids (current version only)."""
+        if not media_ids:
+            return {}
+        found: dict[str, np.ndarray] = {}
+        with self._lock:
+            for i in range(0, len(media_ids), 500):
+                chunk = media_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT media_id, version, vector FROM mfcc_features WHERE media_id IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                for media_id, version, blob in rows:
+                    if version != self.version:
+                        self.stale += 1
+                        continue
+                    found[media_id] = np.frombuffer(blob, dtype=np.float32).copy()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE mfcc_features SET last_used = ? WHERE media_id = ?",
+                    [(now, mid) for mid in found],
+                )
+            self.hits += len(found)
+            self.misses += len(set(media_ids)) - len(found)
+        return found
+
+    def get_by_hash(self, content_hash: str) -> Optional[np.ndarray]:
+        """Return a vector for identical bytes stored under another media_id."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector FROM mfcc_features WHERE content_hash = ? AND version = ? LIMIT 1",
+                (content_hash, self.version),
+            ).fetchone()
+        return np.frombuffer(row[0], dtype=np.float32).copy() if row else None
+
+    def put(self, media_id: str, content_hash: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO mfcc_features (media_id, content_hash, version, vector, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (media_id, content_hash, self.version, vector.astype(np.float32).tobytes(), time.time()),
+            )
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM mfcc_features").fetchone()
+        if count <= self.max_entries:
+            return
+        n_evict = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM mfcc_features WHERE media_id IN "
+            "(SELECT media_id FROM mfcc_features ORDER BY last_used ASC LIMIT ?)",
+            (n_evict,),
         )
+        self.evictions += n_evict
 
-    return media_record, response.content
+    def stats(self) -> dict:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM mfcc_features").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "entries": count,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
 
 
-def extract_mfcc_features(audio_bytes: bytes, ext: str = ".mp3", sr: int = 16000) -> np.ndarray:
-    """Generate a compact audio fingerprint using MFCC mean and standard deviation (40-dim)."""
+feature_cache = FeatureCache(FEATURE_CACHE_PATH, FEATURE_CACHE_MAX_ENTRIES, FEATURE_EXTRACTOR_VERSION)
 
-    with tempfile.NamedTemporaryFile(suffix=ext, delete=True) as temp_file:
-        temp_file.write(audio_bytes)
-        temp_file.flush()
-        audio_signal, sample_rate = librosa.load(temp_file.name, sr=sr, mono=True)
 
-    # MFCC shape: (n_mfcc, time_frames)
-    mfcc_features = librosa.feature.mfcc(y=audio_signal, sr=sample_rate, n_mfcc=20)
+@app.get("/debug/feature-cache")
+def debug_feature_cache():
+    return feature_cache.stats()
 
-    feature_vector = np.concatenate(
-        [mfcc_features.mean(axis=1), mfcc_features.std(axis=1)],
-        axis=0
-    )
 
-    return feature_vector.astype(np.float32)
+# Parallel downloads for baseline rebuilds. Clips go through the shared
+# keep-alive `http_client`; this caps how many are in flight at once.
+SOUND_DOWNLOAD_CONCURRENCY = int(os.getenv("SOUND_DOWNLOAD_CONCURRENCY", "8"))
+# PostgREST puts `in` filters in the URL, so very large id lists are chunked.
+MEDIA_IN_CHUNK = 200
+
+
+def _clip_ext(media_record: dict) -> str:
+    return os.path.splitext(media_record["path"])[1] or ".mp3"
+
+
+async def _fetch_media_rows(media_ids: list[str]) -> dict[str, dict]:
+    """Fetch media rows for many ids with bulk `in` queries (one per MEDIA_IN_CHUNK ids)."""
+    unique_ids = list(dict.fromkeys(media_ids))
+    rows: dict[str, dict] = {}
+    for i in range(0, len(unique_ids), MEDIA_IN_CHUNK):
+        chunk = unique_ids[i:i + MEDIA_IN_CHUNK]
+        resp = await (
+            asupabase.table("media")
+            .select("id,bucket,path")
+            .in_("id", chunk)
+            .execute()
+        )
+        for r in resp.data or []:
+            rows[r["id"]] = r
+    return rows
+
+
+async def _download_clips(
+    media_rows: list[dict],
+    concurrency: int = SOUND_DOWNLOAD_CONCURRENCY,
+) -> tuple[dict[str, bytes], dict[str, str]]:
+    """Download clips concurrently over the pooled client.
+
+    Returns (bytes by media_id, error message by media_id); one bad clip never
+    fails the whole batch.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _one(row: dict) -> tuple[str, Optional[bytes], Optional[str]]:
+        url = public_storage_url(row["bucket"], row["path"])
+        async with sem:
+            try:
+                r = await http_client.get(url)
+            except httpx.HTTPError as e:
+                return row["id"], None, f"download error: {e}"
+        if r.status_code != 200 or not r.content:
+            return row["id"], None, f"download failed: {r.status_code}"
+        return row["id"], r.content, None
+
+    results = await asyncio.gather(*(_one(row) for row in media_rows))
+
+    clips: dict[str, bytes] = {}
+    errors: dict[str, str] = {}
+    for media_id, content, error in results:
+        if error:
+            errors[media_id] = error
+        else:
+            clips[media_id] = content
+    return clips, errors
+
+
+async def _load_features(
+    media_ids: list[str],
+    media_rows: Optional[dict[str, dict]] = None,
+) -> tuple[dict[str, np.ndarray], dict[str, str], dict[str, float]]:
+    """Return MFCC vectors for `media_ids`, decoding only clips missing from the feature cache.
+
+    Returns (features by media_id, error by media_id, timings in ms). The SQLite
+    feature cache is blocking, so its reads and writes run on a worker thread.
+    """
+    timings: dict[str, float] = {}
+    t0 = time.perf_counter()
+    feats = await asyncio.to_thread(feature_cache.get_many, list(dict.fromkeys(media_ids)))
+    timings["cache_lookup"] = _ms_since(t0)
+
+    missing = [mid for mid in dict.fromkeys(media_ids) if mid not in feats]
+    errors: dict[str, str] = {}
+    if not missing:
+        return feats, errors, timings
+
+    t0 = time.perf_counter()
+    if media_rows is None or any(mid not in media_rows for mid in missing):
+        media_rows = {**(media_rows or {}), **await _fetch_media_rows(missing)}
+    timings["media_query"] = _ms_since(t0)
+    for mid in missing:
+        if mid not in media_rows:
+            errors[mid] = "media row not found"
+
+    t0 = time.perf_counter()
+    clips, download_errors = await _download_clips([media_rows[mid] for mid in missing if mid in media_rows])
+    timings["download"] = _ms_since(t0)
+    errors.update(download_errors)
+
+    def reuse_by_hash() -> tuple[dict[str, np.ndarray], list[tuple[str, str]]]:
+        # Identical bytes already fingerprinted under another media_id
+        reused: dict[str, np.ndarray] = {}
+        to_extract: list[tuple[str, str]] = []  # (media_id, content hash)
+        for mid, content in clips.items():
+            content_hash = hashlib.sha256(content).hexdigest()
+            feat = feature_cache.get_by_hash(content_hash)
+            if feat is None:
+                to_extract.append((mid, content_hash))
+                continue
+            feature_cache.put(mid, content_hash, feat)
+            reused[mid] = feat
+        return reused, to_extract
+
+    def store(extracted: list[tuple[str, str, np.ndarray]]) -> None:
+        for mid, content_hash, feat in extracted:
+            feature_cache.put(mid, content_hash, feat)
+
+    t0 = time.perf_counter()
+    reused, to_extract = await asyncio.to_thread(reuse_by_hash)
+    feats.update(reused)
+
+    results = await sound_pool.extract([(clips[mid], _clip_ext(media_rows[mid])) for mid, _ in to_extract])
+    extracted: list[tuple[str, str, np.ndarray]] = []
+    for (mid, content_hash), (feat, error) in zip(to_extract, results):
+        if feat is None:
+            errors[mid] = error
+            continue
+        extracted.append((mid, content_hash, feat))
+        feats[mid] = feat
+    if extracted:
+        await asyncio.to_thread(store, extracted)
+    timings["extract"] = _ms_since(t0)
+
+    return feats, errors, timings
+
+
+# Parsed baselines kept in process. A cached entry is served as-is for
+# BASELINE_CACHE_TTL_S; after that a cheap `updated_at`-only query revalidates
+# it, and the arrays are reloaded only if the baseline changed in the meantime
+# (e.g. rebuilt by another worker). Local rebuilds/updates refresh it directly.
+# Versions are compared as instants, not strings: Postgres returns timestamptz
+# in its own spelling, not the isoformat() string the writer sent.
+BASELINE_CACHE_SIZE = int(os.getenv("BASELINE_CACHE_SIZE", "256"))
+BASELINE_CACHE_TTL_S = float(os.getenv("BASELINE_CACHE_TTL_S", "60"))
+
+
+class Baseline(NamedTuple):
+    mean: np.ndarray  # float32 (40,)
+    std: np.ndarray  # float32 (40,)
+    threshold: float
+    updated_at: Optional[str]
+
+
+class BaselineCache:
+    """LRU cache of ready-to-score baselines keyed by (machine_id, mode)."""
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[tuple[str, str], tuple[Baseline, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.reloads = 0
+
+    @staticmethod
+    def _parse(row: dict) -> Baseline:
+        return Baseline(
+            mean=np.array(row["feature_mean"], dtype=np.float32),
+            std=np.array(row["feature_std"], dtype=np.float32),
+            threshold=float(row["threshold"]),
+            updated_at=row.get("updated_at"),
+        )
+
+    def put(self, key: tuple[str, str], baseline: Baseline) -> None:
+        self._entries[key] = (baseline, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: tuple[str, str]) -> None:
+        self._entries.pop(key, None)
+
+    @staticmethod
+    def _same_version(a: Optional[str], b: Optional[str]) -> bool:
+        if not a or not b:
+            return False
+        ts = _parse_ts(a)  # 0.0 if unparsable: treat as changed
+        return ts > 0 and ts == _parse_ts(b)
+
+    async def get_many(self, pairs: set[tuple[str, str]]) -> dict[tuple[str, str], Baseline]:
+        """Return baselines for the requested (machine_id, mode) pairs; missing ones are omitted."""
+        now = time.monotonic()
+        found: dict[tuple[str, str], Baseline] = {}
+        stale: dict[tuple[str, str], Baseline] = {}
+        for key in pairs:
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            baseline, checked_at = entry
+            if now - checked_at <= self.ttl_s:
+                found[key] = baseline
+                self._entries.move_to_end(key)
+            else:
+                stale[key] = baseline
+        self.hits += len(found)
+
+        if stale:
+            self.revalidations += len(stale)
+            rows = await self._query(set(stale), "machine_id,mode,updated_at")
+            for row in rows:
+                key = (row["machine_id"], row["mode"])
+                if key in stale and self._same_version(row.get("updated_at"), stale[key].updated_at):
+                    found[key] = stale[key]
+                    self.put(key, stale[key])
+                    self.hits += 1
+
+        missing = pairs - set(found)
+        if missing:
+            self.misses += len(missing)
+            self.reloads += len(missing & set(stale))
+            rows = await self._query(missing, "machine_id,mode,feature_mean,feature_std,threshold,updated_at")
+            for row in rows:
+                key = (row["machine_id"], row["mode"])
+                if key in missing:
+                    found[key] = self._parse(row)
+                    self.put(key, found[key])
+            for key in missing - set(found):
+                self.invalidate(key)
+        return found
+
+    @staticmethod
+    async def _query(pairs: set[tuple[str, str]], columns: str) -> list[dict]:
+        resp = await (
+            asupabase.table("sound_baselines")
+            .select(columns)
+            .in_("machine_id", sorted({m for m, _ in pairs}))
+            .in_("mode", sorted({md for _, md in pairs}))
+            .execute()
+        )
+        return resp.data or []
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "reloads": self.reloads,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+baseline_cache = BaselineCache(BASELINE_CACHE_SIZE, BASELINE_CACHE_TTL_S)
+
+
+@app.get("/debug/baseline-cache")
+def debug_baseline_cache():
+    return baseline_cache.stats()
+
+
+def _calibrate_threshold(clip_scores: dict[str, dict]) -> tuple[float, Optional[float], float]:
+    """Pick the GOOD/BAD decision threshold from per-clip scores.
+
+    Returns (max_good, min_bad, threshold).
+    """
+    good_scores = [c["score"] for c in clip_scores.values() if c["label"] == "good"]
+    bad_scores = [c["score"] for c in clip_scores.values() if c["label"] == "bad"]
+
+    # Threshold calibration
+    max_good = float(max(good_scores))
+    threshold = max_good * 1.15
+    min_bad = float(min(bad_scores)) if bad_scores else None
+    if min_bad is not None and max_good < min_bad:
+        threshold = (max_good + min_bad) / 2.0
+    return max_good, min_bad, threshold
 
 
-def anomaly_score(feat: np.ndarray, mean: np.ndarray, std: np.ndarray) -> float:
-    """Calculate anomaly score using z-score distance mapped to a 0–100 range."""
+def _welford_add(n: int, mean: np.ndarray, m2: np.ndarray, x: np.ndarray) -> tuple[int, np.ndarray, np.ndarray]:
+    n += 1
+    delta = x - mean
+    mean = mean + delta / n
+    m2 = m2 + delta * (x - mean)
+    return n, mean, m2
 
-    z_scores = np.abs((feat - mean) / (std + 1e-6))
-    avg_distance = float(np.mean(z_scores))
 
-    score = min(100.0, avg_distance * 20.0)
-    return score
+def _welford_remove(n: int, mean: np.ndarray, m2: np.ndarray, x: np.ndarray) -> tuple[int, np.ndarray, np.ndarray]:
+    if n <= 1:
+        return 0, np.zeros_like(mean), np.zeros_like(m2)
+    n_new = n - 1
+    mean_new = (n * mean - x) / n_new
+    m2 = np.maximum(m2 - (x - mean) * (x - mean_new), 0.0)
+    return n_new, mean_new, m2
 
 
 @app.post("/sound/baseline/rebuild")
-def rebuild_sound_baseline(machine_id: str, mode: str = "idle"):
+async def rebuild_sound_baseline(machine_id: str, mode: str = "idle"):
     """Build a baseline from labeled GOOD clips for a machine/mode and auto-calibrate threshold."""
-    samples = (
-        supabase.table("sound_samples")
+    t_start = time.perf_counter()
+    timings: dict[str, float] = {}
+
+    t0 = time.perf_counter()
+    samples_resp = await (
+        asupabase.table("sound_samples")
         .select("media_id,label,mode,machine_id")
         .eq("machine_id", machine_id)
         .eq("mode", mode)
         .execute()
-        .data
-        or []
     )
+    samples = samples_resp.data or []
     if not samples:
         raise HTTPException(status_code=404, detail="No sound_samples found for this machine/mode")
 
@@ -1144,116 +4000,242 @@ def rebuild_sound_baseline(machine_id: str, mode: str = "idle"):
     if len(good_ids) < 2:
         raise HTTPException(status_code=400, detail="Need at least 2 GOOD clips to build a baseline")
 
-    good_feats: list[np.ndarray] = []
-    for mid in good_ids:
-        mrow = (
-            supabase.table("media")
-            .select("id,bucket,path")
-            .eq("id", mid)
-            .limit(1)
-            .execute()
-            .data
-        )
-        if not mrow:
-            continue
-        mrow = mrow[0]
-        url = public_storage_url(mrow["bucket"], mrow["path"])
-        r = requests.get(url, timeout=60)
-        if r.status_code != 200 or not r.content:
-            continue
-        ext = os.path.splitext(mrow["path"])[1] or ".mp3"
-        good_feats.append(extract_mfcc_features(r.content, ext=ext))
+    timings["samples_query"] = _ms_since(t0)
+
+    # Cached vectors are reused; only new or stale clips are queried, downloaded and decoded
+    labels = {mid: "good" for mid in good_ids}
+    labels.update({mid: "bad" for mid in bad_ids})
+    feats, errors, load_timings = await _load_features(good_ids + bad_ids)
+    timings.update(load_timings)
+    failures = [
+        {"media_id": mid, "label": labels.get(mid), "error": error}
+        for mid, error in errors.items()
+    ]
 
+    good_feats = [feats[mid] for mid in good_ids if mid in feats]
     if len(good_feats) < 2:
         raise HTTPException(status_code=400, detail="Could not load enough GOOD audio clips")
 
     good_mat = np.stack(good_feats, axis=0)  # (N, 40)
     mean = good_mat.mean(axis=0)
     std = good_mat.std(axis=0) + 1e-6
+    # Running sufficient statistics so /sound/baseline/update can fold clips in and out
+    m2 = ((good_mat - mean) ** 2).sum(axis=0)
 
-    scores_good = [anomaly_score(f, mean, std) for f in good_mat]
-    max_good = float(max(scores_good))
-
-    scores_bad: list[float] = []
+    clip_scores: dict[str, dict] = {}
+    for mid in good_ids:
+        if mid in feats:
+            clip_scores[mid] = {"label": "good", "score": anomaly_score(feats[mid], mean, std)}
     for mid in bad_ids:
-        mrow = (
-            supabase.table("media")
-            .select("id,bucket,path")
-            .eq("id", mid)
-            .limit(1)
-            .execute()
-            .data
-        )
-        if not mrow:
-            continue
-        mrow = mrow[0]
-        url = public_storage_url(mrow["bucket"], mrow["path"])
-        r = requests.get(url, timeout=60)
-        if r.status_code != 200 or not r.content:
-            continue
-        ext = os.path.splitext(mrow["path"])[1] or ".mp3"
-        f = extract_mfcc_features(r.content, ext=ext)
-        scores_bad.append(anomaly_score(f, mean, std))
+        if mid in feats:
+            clip_scores[mid] = {"label": "bad", "score": anomaly_score(feats[mid], mean, std)}
 
-    # Threshold calibration
-    threshold = max_good * 1.15
-    min_bad = float(min(scores_bad)) if scores_bad else None
-    if min_bad is not None and max_good < min_bad:
-        threshold = (max_good + min_bad) / 2.0
+    max_good, min_bad, threshold = _calibrate_threshold(clip_scores)
+    scores_bad = [c for c in clip_scores.values() if c["label"] == "bad"]
 
-    # Store baseline (requires sound_baselines table)
-    supabase.table("sound_baselines").upsert(
+    # Store baseline (see the sound_baselines migration note above)
+    t0 = time.perf_counter()
+    updated_at = datetime.now(timezone.utc).isoformat()
+    await asupabase.table("sound_baselines").upsert(
         {
             "machine_id": machine_id,
             "mode": mode,
             "feature_mean": mean.tolist(),
             "feature_std": std.tolist(),
             "threshold": float(threshold),
+            "n_good": len(good_feats),
+            "feature_m2": m2.tolist(),
+            "clip_scores": clip_scores,
+            "updated_at": updated_at,
         },
         on_conflict="machine_id,mode",
     ).execute()
+    baseline_cache.put(
+        (machine_id, mode),
+        Baseline(mean.astype(np.float32), std.astype(np.float32), float(threshold), updated_at),
+    )
+    timings["store"] = _ms_since(t0)
+    timings["total"] = _ms_since(t_start)
 
     return {
         "machine_id": machine_id,
         "mode": mode,
         "n_good": len(good_ids),
         "n_bad": len(bad_ids),
+        "n_good_used": len(good_feats),
+        "n_bad_used": len(scores_bad),
+        "max_good": max_good,
+        "min_bad": min_bad,
+        "threshold": float(threshold),
+        "failures": failures,
+        "timings_ms": timings,
+    }
+
+
+class SoundClipRef(BaseModel):
+    media_id: str
+    label: Literal["good", "bad"]
+
+
+class SoundBaselineUpdateRequest(BaseModel):
+    machine_id: str
+    mode: str = "idle"
+    add: list[SoundClipRef] = []
+    remove: list[str] = []
+
+
+# Incremental updates are read-modify-write: the write only lands if the row's
+# updated_at is still the one that was read, otherwise the update is redone
+# against the fresh row, up to SOUND_BASELINE_WRITE_MAX_ATTEMPTS times.
+SOUND_BASELINE_WRITE_MAX_ATTEMPTS = int(os.getenv("SOUND_BASELINE_WRITE_MAX_ATTEMPTS", "5"))
+
+
+@app.post("/sound/baseline/update")
+async def update_sound_baseline(req: SoundBaselineUpdateRequest):
+    """Fold clips into (or out of) an existing baseline without a full rebuild.
+
+    GOOD clips update the stored count/mean/M2 one at a time (Welford). BAD
+    clips only contribute a score. Each added clip is scored against the
+    updated baseline, and the threshold is recalibrated from the stored
+    per-clip scores. Scores of clips already in the baseline are not recomputed
+    here; /sound/baseline/rebuild refreshes all of them. A concurrent update of
+    the same baseline makes this one start over from the fresh row (409 if it
+    keeps losing).
+    """
+    feats: dict[str, np.ndarray] = {}
+    errors: dict[str, str] = {}
+    timings: dict[str, float] = {}
+    for attempt in range(1, SOUND_BASELINE_WRITE_MAX_ATTEMPTS + 1):
+        b_resp = await (
+            asupabase.table("sound_baselines")
+            .select("feature_mean,feature_std,threshold,n_good,feature_m2,clip_scores,updated_at")
+            .eq("machine_id", req.machine_id)
+            .eq("mode", req.mode)
+            .limit(1)
+            .execute()
+        )
+        rows = b_resp.data or []
+        if not rows:
+            raise HTTPException(status_code=400, detail="No baseline found. Call /sound/baseline/rebuild first.")
+        b = rows[0]
+        if b.get("n_good") is None or b.get("feature_m2") is None:
+            raise HTTPException(status_code=409, detail="Baseline predates incremental stats. Call /sound/baseline/rebuild once.")
+
+        n = int(b["n_good"])
+        mean = np.array(b["feature_mean"], dtype=np.float64)
+        m2 = np.array(b["feature_m2"], dtype=np.float64)
+        clip_scores: dict[str, dict] = dict(b.get("clip_scores") or {})
+
+        add = [c for c in req.add if c.media_id not in clip_scores]
+        remove = [mid for mid in dict.fromkeys(req.remove) if mid in clip_scores]
+        good_removals = [mid for mid in remove if clip_scores[mid]["label"] == "good"]
+
+        # Features survive retries; only clips not tried yet are loaded
+        needed = [mid for mid in [c.media_id for c in add] + good_removals if mid not in feats and mid not in errors]
+        if needed:
+            new_feats, new_errors, new_timings = await _load_features(needed)
+            feats.update(new_feats)
+            errors.update(new_errors)
+            for stage, ms in new_timings.items():
+                timings[stage] = round(timings.get(stage, 0.0) + ms, 3)
+
+        removed: list[str] = []
+        for mid in remove:
+            if mid in good_removals:
+                if mid not in feats:
+                    continue
+                n, mean, m2 = _welford_remove(n, mean, m2, feats[mid].astype(np.float64))
+            clip_scores.pop(mid)
+            removed.append(mid)
+
+        added = [c for c in add if c.media_id in feats]
+        for c in added:
+            if c.label == "good":
+                n, mean, m2 = _welford_add(n, mean, m2, feats[c.media_id].astype(np.float64))
+
+        if n < 2:
+            raise HTTPException(status_code=400, detail="Baseline would have fewer than 2 GOOD clips")
+
+        std = np.sqrt(m2 / n) + 1e-6
+        for c in added:
+            clip_scores[c.media_id] = {
+                "label": c.label,
+                "score": anomaly_score(feats[c.media_id], mean, std),
+            }
+
+        max_good, min_bad, threshold = _calibrate_threshold(clip_scores)
+
+        updated_at = datetime.now(timezone.utc).isoformat()
+        query = (
+            asupabase.table("sound_baselines")
+            .update({
+                "feature_mean": mean.tolist(),
+                "feature_std": std.tolist(),
+                "threshold": float(threshold),
+                "n_good": n,
+                "feature_m2": m2.tolist(),
+                "clip_scores": clip_scores,
+                "updated_at": updated_at,
+            })
+            .eq("machine_id", req.machine_id)
+            .eq("mode", req.mode)
+        )
+        if b.get("updated_at") is None:
+            query = query.is_("updated_at", "null")
+        else:
+            query = query.eq("updated_at", b["updated_at"])
+        resp = await query.execute()
+        if resp.data:
+            break
+        # Someone else wrote first: redo the update against the fresh row
+    else:
+        raise HTTPException(status_code=409, detail="Baseline was modified concurrently, please retry")
+
+    failures = [{"media_id": mid, "error": error} for mid, error in errors.items()]
+    baseline_cache.put(
+        (req.machine_id, req.mode),
+        Baseline(mean.astype(np.float32), std.astype(np.float32), float(threshold), updated_at),
+    )
+
+    return {
+        "machine_id": req.machine_id,
+        "mode": req.mode,
+        "added": [c.media_id for c in added],
+        "removed": removed,
+        "n_good": n,
         "max_good": max_good,
         "min_bad": min_bad,
         "threshold": float(threshold),
+        "failures": failures,
+        "timings_ms": timings,
+        "attempts": attempt,
     }
 
 
 @app.post("/sound/check")
-def sound_check(media_id: str, machine_id: str = "demo-machine", mode: str = "idle"):
+async def sound_check(media_id: str, machine_id: str = "demo-machine", mode: str = "idle"):
     """Score a single machine-sound clip against the stored baseline."""
-    b = (
-        supabase.table("sound_baselines")
-        .select("feature_mean,feature_std,threshold")
-        .eq("machine_id", machine_id)
-        .eq("mode", mode)
-        .limit(1)
-        .execute()
-        .data
-        or []
-    )
-    if not b:
+    baselines = await baseline_cache.get_many({(machine_id, mode)})
+    if not baselines:
         raise HTTPException(status_code=400, detail="No baseline found. Call /sound/baseline/rebuild first.")
 
-    b = b[0]
-    mean = np.array(b["feature_mean"], dtype=np.float32)
-    std = np.array(b["feature_std"], dtype=np.float32)
-    threshold = float(b["threshold"])
+    mean, std, threshold, _ = baselines[(machine_id, mode)]
 
-    row, audio_bytes = _download_media_bytes(media_id)
-    ext = os.path.splitext(row["path"])[1] or ".mp3"
-    feat = extract_mfcc_features(audio_bytes, ext=ext)
+    media_rows = await _fetch_media_rows([media_id])
+    if media_id not in media_rows:
+        raise HTTPException(status_code=404, detail="media_id not found")
+    row = media_rows[media_id]
+
+    feats, errors, _ = await _load_features([media_id], media_rows)
+    if media_id not in feats:
+        raise HTTPException(status_code=500, detail=errors.get(media_id, "feature extraction failed"))
+    feat = feats[media_id]
     score = anomaly_score(feat, mean, std)
 
     predicted = "bad" if score >= threshold else "good"
 
     # Store assessment (requires sound_assessments table)
-    supabase.table("sound_assessments").insert(
+    await asupabase.table("sound_assessments").insert(
         {
             "media_id": media_id,
             "machine_id": machine_id,
@@ -1271,3 +4253,157 @@ def sound_check(media_id: str, machine_id: str = "demo-machine", mode: str = "id
         "threshold": threshold,
         "predicted_label": predicted,
     }
+
+
+SOUND_CHECK_BATCH_MAX = int(os.getenv("SOUND_CHECK_BATCH_MAX", "500"))
+
+
+class SoundCheckItem(BaseModel):
+    media_id: str
+    machine_id: str = "demo-machine"
+    mode: str = "idle"
+
+
+class SoundCheckBatchRequest(BaseModel):
+    items: list[SoundCheckItem]
+
+
+@app.post("/sound/check/batch")
+async def sound_check_batch(req: SoundCheckBatchRequest):
+    """Score many clips at once: one baseline load per (machine, mode), parallel feature
+    extraction, one vectorized scoring pass per baseline and a single bulk insert."""
+    if not req.items:
+        return {"results": [], "timings_ms": {}}
+    if len(req.items) > SOUND_CHECK_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {SOUND_CHECK_BATCH_MAX} items per batch")
+
+    t_start = time.perf_counter()
+    timings: dict[str, float] = {}
+
+    # Baselines come from the in-process cache; misses are loaded with one query
+    t0 = time.perf_counter()
+    pairs = {(it.machine_id, it.mode) for it in req.items}
+    baselines = await baseline_cache.get_many(pairs)
+    timings["baseline_lookup"] = _ms_since(t0)
+
+    feats, errors, load_timings = await _load_features([it.media_id for it in req.items])
+    timings.update(load_timings)
+
+    t0 = time.perf_counter()
+    results: list[Optional[dict]] = [None] * len(req.items)
+    groups: dict[tuple[str, str], list[int]] = {}
+    for i, it in enumerate(req.items):
+        key = (it.machine_id, it.mode)
+        if key not in baselines:
+            results[i] = {**it.model_dump(), "error": "No baseline found for this machine/mode"}
+        elif it.media_id not in feats:
+            results[i] = {**it.model_dump(), "error": errors.get(it.media_id, "feature extraction failed")}
+        else:
+            groups.setdefault(key, []).append(i)
+
+    assessments: list[dict] = []
+    for key, idxs in groups.items():
+        mean, std, threshold, _ = baselines[key]
+        mat = np.stack([feats[req.items[i].media_id] for i in idxs], axis=0)
+        scores = anomaly_scores(mat, mean, std)
+        for i, score in zip(idxs, scores):
+            it = req.items[i]
+            predicted = "bad" if score >= threshold else "good"
+            assessments.append(
+                {
+                    "media_id": it.media_id,
+                    "machine_id": it.machine_id,
+                    "mode": it.mode,
+                    "anomaly_score": float(score),
+                    "predicted_label": predicted,
+                }
+            )
+            results[i] = {**assessments[-1], "threshold": threshold}
+    timings["score"] = _ms_since(t0)
+
+    # Store all assessments in one insert (requires sound_assessments table)
+    t0 = time.perf_counter()
+    if assessments:
+        await asupabase.table("sound_assessments").insert(assessments).execute()
+    timings["store"] = _ms_since(t0)
+    timings["total"] = _ms_since(t_start)
+
+    return {
+        "n_items": len(req.items),
+        "n_scored": len(assessments),
+        "n_failed": len(req.items) - len(assessments),
+        "results": results,
+        "timings_ms": timings,
+    }
+
+
+# Long recordings are spooled here while downloading: in memory up to this
+# size, then on disk, so a 10-minute run doesn't sit in RAM.
+SOUND_SPOOL_MAX_BYTES = int(os.getenv("SOUND_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+
+
+@app.post("/sound/check/windows")
+async def sound_check_windows(
+    media_id: str,
+    machine_id: str = "demo-machine",
+    mode: str = "idle",
+    window_s: float = 5.0,
+):
+    """Score a long recording window by window and report the anomaly timeline and its peak.
+
+    Decoding is streamed in fixed blocks, so memory stays bounded regardless of
+    recording length, and a short knock isn't averaged away over the whole clip.
+    """
+    if not 1.0 <= window_s <= 60.0:
+        raise HTTPException(status_code=400, detail="window_s must be between 1 and 60 seconds")
+
+    baselines = await baseline_cache.get_many({(machine_id, mode)})
+    if not baselines:
+        raise HTTPException(status_code=400, detail="No baseline found. Call /sound/baseline/rebuild first.")
+    mean, std, threshold, _ = baselines[(machine_id, mode)]
+
+    media_rows = await _fetch_media_rows([media_id])
+    if media_id not in media_rows:
+        raise HTTPException(status_code=404, detail="media_id not found")
+    row = media_rows[media_id]
+
+    with tempfile.SpooledTemporaryFile(max_size=SOUND_SPOOL_MAX_BYTES) as spool:
+        url = public_storage_url(row["bucket"], row["path"])
+        async with http_client.stream("GET", url) as r:
+            if r.status_code != 200:
+                raise HTTPException(status_code=500, detail=f"download failed: {r.status_code}")
+            async for chunk in r.aiter_bytes():
+                spool.write(chunk)
+        if spool.tell() == 0:
+            raise HTTPException(status_code=500, detail="download failed: empty file")
+        spool.seek(0)
+
+        try:
+            windows = await asyncio.to_thread(score_windows, spool, _clip_ext(row), mean, std, window_s)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"decode failed: {e}")
+
+    if not windows:
+        raise HTTPException(status_code=400, detail="Recording too short to score")
+
+    timeline = [
+        {"start_s": round(start, 3), "end_s": round(end, 3), "score": float(score), "over_threshold": score >= threshold}
+        for start, end, score in windows
+    ]
+    peak = max(timeline, key=lambda w: w["score"])
+
+    return {
+        "media_id": media_id,
+        "machine_id": machine_id,
+        "mode": mode,
+        "window_s": window_s,
+        "duration_s": timeline[-1]["end_s"],
+        "n_windows": len(timeline),
+        "windows_over_threshold": sum(1 for w in timeline if w["over_threshold"]),
+        "peak_score": peak["score"],
+        "peak_start_s": peak["start_s"],
+        "peak_end_s": peak["end_s"],
+        "threshold": threshold,
+        "predicted_label": "bad" if peak["score"] >= threshold else "good",
+        "timeline": timeline,
+    }
@@ -0,0 +1,262 @@
+"""Embedded vector index for inspection history (local alternative to Supermemory).
+
+One index per partition tag (e.g. "machine:CAT 320"), held in RAM as a float32
+matrix of unit vectors and persisted as .npz under MEMORY_INDEX_DIR.
+Embeddings are hashed word/bigram/character-trigram features, so no model or
+network call is needed and search is a single matrix-vector product.
+"""
+from collections import OrderedDict
+from typing import Optional
+import hashlib
+import os
+import re
+import threading
+import time
+import zlib
+
+import numpy as np
+
+MEMORY_INDEX_DIR = os.getenv("MEMORY_INDEX_DIR", os.path.join(os.path.dirname(__file__), "..", "memory_index"))
+MEMORY_INDEX_DIM = int(os.getenv("MEMORY_INDEX_DIM", "512"))
+# Per-partition cap; the oldest entries are dropped at compaction.
+MEMORY_INDEX_MAX_ITEMS = int(os.getenv("MEMORY_INDEX_MAX_ITEMS", "2000"))
+# Partitions kept in RAM; others are reloaded from disk on demand.
+MEMORY_INDEX_MAX_PARTITIONS = int(os.getenv("MEMORY_INDEX_MAX_PARTITIONS", "256"))
+# Hits scoring below this cosine similarity are not returned.
+MEMORY_INDEX_MIN_SCORE = float(os.getenv("MEMORY_INDEX_MIN_SCORE", "0.1"))
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def embed(text: str, dim: int = MEMORY_INDEX_DIM) -> np.ndarray:
+    """Unit-length hashed feature vector: words, word bigrams and character trigrams.
+
+    crc32 keeps buckets stable across processes, so persisted vectors stay valid.
+    """
+    vec = np.zeros(dim, dtype=np.float32)
+    words = _TOKEN.findall((text or "").lower())
+    for w in words:
+        vec[zlib.crc32(b"w:" + w.encode()) % dim] += 2.0
+        padded = f" {w} "
+        for i in range(len(padded) - 2):
+            vec[zlib.crc32(padded[i:i + 3].encode()) % dim] += 0.5
+    for a, b in zip(words, words[1:]):
+        vec[zlib.crc32(f"b:{a} {b}".encode()) % dim] += 1.0
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+class PartitionIndex:
+    """Append-only vector matrix with tombstones; compaction rewrites it densely."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.texts: list[str] = []
+        self.keys: list[str] = []
+        self.created: list[float] = []
+        self.live = np.zeros(0, dtype=bool)
+        self.size = 0  # rows in use (live or tombstoned)
+        self._by_key: dict[str, int] = {}
+
+    @property
+    def live_count(self) -> int:
+        return int(self.live[:self.size].sum())
+
+    def add(self, text: str, key: str, created: float) -> None:
+        old = self._by_key.get(key)
+        if old is not None:
+            self.live[old] = False
+        if self.size == len(self.vectors):
+            # Grow geometrically so appends stay amortized O(1)
+            cap = max(16, 2 * len(self.vectors))
+            self.vectors = np.resize(self.vectors, (cap, self.dim))
+            self.live = np.resize(self.live, cap)
+        self.vectors[self.size] = embed(text, self.dim)
+        self.live[self.size] = True
+        self.texts.append(text)
+        self.keys.append(key)
+        self.created.append(created)
+        self._by_key[key] = self.size
+        self.size += 1
+
+    def search(self, query_vec: np.ndarray, k: int, min_score: float) -> list[tuple[float, str]]:
+        if self.size == 0 or k <= 0:
+            return []
+        scores = self.vectors[:self.size] @ query_vec
+        scores[~self.live[:self.size]] = -1.0
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.texts[i]) for i in top if scores[i] >= min_score]
+
+    def needs_compaction(self, max_items: int) -> bool:
+        # Some slack so a full partition isn't rewritten on every add
+        live = self.live_count
+        return self.size - live > max(16, self.size // 4) or live > max_items + max(16, max_items // 10)
+
+    def compact(self, max_items: int) -> int:
+        """Drop tombstones and the oldest entries beyond max_items. Returns rows removed."""
+        keep = np.flatnonzero(self.live[:self.size])
+        if len(keep) > max_items:
+            keep = keep[np.argsort(np.asarray(self.created)[keep], kind="stable")[-max_items:]]
+            keep.sort()
+        removed = self.size - len(keep)
+        self._load(
+            self.vectors[keep].copy(),
+            [self.texts[i] for i in keep],
+            [self.keys[i] for i in keep],
+            [self.created[i] for i in keep],
+        )
+        return removed
+
+    def _load(self, vectors: np.ndarray, texts: list[str], keys: list[str], created: list[float]) -> None:
+        self.vectors = vectors.astype(np.float32, copy=False)
+        self.texts = texts
+        self.keys = keys
+        self.created = created
+        self.size = len(texts)
+        self.live = np.ones(self.size, dtype=bool)
+        self._by_key = {key: i for i, key in enumerate(keys)}
+
+    def save(self, path: str) -> None:
+        """Compacted snapshot written atomically (tmp file + rename)."""
+        live = np.flatnonzero(self.live[:self.size])
+        tmp = f"{path}.tmp.npz"
+        np.savez(
+            tmp,
+            vectors=self.vectors[live],
+            texts=np.array([self.texts[i] for i in live], dtype=str),
+            keys=np.array([self.keys[i] for i in live], dtype=str),
+            created=np.array([self.created[i] for i in live], dtype=np.float64),
+        )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, dim: int) -> "PartitionIndex":
+        index = cls(dim)
+        with np.load(path, allow_pickle=False) as data:
+            vectors = data["vectors"]
+            if vectors.ndim != 2 or vectors.shape[1] != dim:
+                # Written with another MEMORY_INDEX_DIM: re-embed the stored texts
+                vectors = np.stack([embed(t, dim) for t in data["texts"]]) if len(data["texts"]) else np.zeros((0, dim), dtype=np.float32)
+            index._load(vectors, data["texts"].tolist(), data["keys"].tolist(), data["created"].tolist())
+        return index
+
+
+class MemoryIndex:
+    """Per-partition PartitionIndex objects, LRU-bounded in RAM and persisted on every write."""
+
+    def __init__(self, root: str, dim: int, max_items: int, max_partitions: int, min_score: float):
+        self.root = root
+        self.dim = dim
+        self.max_items = max_items
+        self.max_partitions = max_partitions
+        self.min_score = min_score
+        self._partitions: "OrderedDict[str, PartitionIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.adds = 0
+        self.compactions = 0
+        self.loads = 0
+        self.search_ms_total = 0.0
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, partition: str) -> str:
+        safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", partition)[:64]
+        digest = hashlib.sha1(partition.encode()).hexdigest()[:10]
+        return os.path.join(self.root, f"{safe}-{digest}.npz")
+
+    def _partition(self, partition: str, create: bool) -> Optional[PartitionIndex]:
+        index = self._partitions.get(partition)
+        if index is not None:
+            self._partitions.move_to_end(partition)
+            return index
+        path = self._path(partition)
+        if os.path.exists(path):
+            try:
+                index = PartitionIndex.load(path, self.dim)
+                self.loads += 1
+            except Exception as e:
+                print(f"Memory index load failed for {partition}:", e)
+                index = None
+        if index is None:
+            if not create:
+                return None
+            index = PartitionIndex(self.dim)
+        self._partitions[partition] = index
+        while len(self._partitions) > self.max_partitions:
+            # Everything is persisted on write, so unloading is free
+            self._partitions.popitem(last=False)
+        return index
+
+    def add(self, partition: str, text: str, key: Optional[str] = None) -> None:
+        """Index `text` under `partition`. Re-adding an existing `key` replaces that entry."""
+        text = (text or "").strip()
+        if not text:
+            return
+        key = key or hashlib.sha1(text.encode()).hexdigest()
+        with self._lock:
+            index = self._partition(partition, create=True)
+            index.add(text, key, time.time())
+            if index.needs_compaction(self.max_items):
+                index.compact(self.max_items)
+                self.compactions += 1
+            index.save(self._path(partition))
+            self.adds += 1
+
+    def search(self, query: str, partitions: list[str], k: int = 5) -> list[str]:
+        """Top-k texts by cosine similarity across `partitions`."""
+        t0 = time.perf_counter()
+        qvec = embed(query, self.dim)
+        hits: list[tuple[float, str]] = []
+        with self._lock:
+            for partition in partitions:
+                index = self._partition(partition, create=False)
+                if index is not None:
+                    hits.extend(index.search(qvec, k, self.min_score))
+            self.searches += 1
+            self.search_ms_total += (time.perf_counter() - t0) * 1000.0
+
+        hits.sort(key=lambda h: -h[0])
+        out: list[str] = []
+        for _, text in hits:
+            if text not in out:
+                out.append(text)
+            if len(out) >= k:
+                break
+        return out
+
+    def compact(self) -> dict:
+        """Compact and re-save every partition on disk (loaded or not)."""
+        removed = 0
+        with self._lock:
+            names = {os.path.basename(self._path(p)): p for p in self._partitions}
+            for fname in sorted(os.listdir(self.root)):
+                if not fname.endswith(".npz") or ".tmp." in fname:
+                    continue
+                path = os.path.join(self.root, fname)
+                index = self._partitions.get(names[fname]) if fname in names else PartitionIndex.load(path, self.dim)
+                removed += index.compact(self.max_items)
+                index.save(path)
+            self.compactions += 1
+        return {"rows_removed": removed}
+
+    def stats(self) -> dict:
+        with self._lock:
+            loaded = {p: idx.live_count for p, idx in self._partitions.items()}
+            resident = sum(idx.vectors.nbytes for idx in self._partitions.values())
+        return {
+            "root": os.path.abspath(self.root),
+            "dim": self.dim,
+            "max_items": self.max_items,
+            "partitions_loaded": len(loaded),
+            "max_partitions": self.max_partitions,
+            "items_loaded": sum(loaded.values()),
+            "resident_bytes": resident,
+            "adds": self.adds,
+            "searches": self.searches,
+            "loads": self.loads,
+            "compactions": self.compactions,
+            "avg_search_ms": round(self.search_ms_total / self.searches, 4) if self.searches else None,
+        }